@@ -0,0 +1,255 @@
+import argparse
+import hashlib
+import json
+import logging
+import os
+import threading
+
+import faiss
+import numpy as np
+import yaml
+
+from Backend.embeddings import normalize_query
+
+
+def file_digest(path, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(chunk_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def answer_cache_fingerprint(rag_dir, index_name, prompt_dict, prompt_template, model_name):
+    """
+    Identifies the FAISS index, the prompts and the model an answer was generated with.
+    Any change to one of them invalidates every precomputed answer.
+    """
+    digest = hashlib.sha256()
+    for name in sorted(os.listdir(rag_dir)):
+        path = os.path.join(rag_dir, name)
+        if name.startswith(index_name) and os.path.isfile(path):
+            # Size and mtime instead of the content, startup must not read the whole index
+            stat = os.stat(path)
+            digest.update(f"{name}:{stat.st_size}:{stat.st_mtime_ns}".encode("utf-8"))
+    digest.update(json.dumps(prompt_dict, sort_keys=True).encode("utf-8"))
+    digest.update(prompt_template.encode("utf-8"))
+    digest.update(model_name.encode("utf-8"))
+    return digest.hexdigest()
+
+
+class ExampleAnswerCache:
+    """
+    Precomputed first-turn answers for the example questions of the frontend.
+
+    Stored as one JSON file:
+        {"fingerprint": ..., "entries": {"<language level>\x1f<question>": {"answer": ..., "context": ...}}}
+    """
+
+    def __init__(self, path, fingerprint):
+        self.path = path
+        self.fingerprint = fingerprint
+        self.entries = {}
+        self._load()
+
+    @staticmethod
+    def key(question, language_level):
+        return f"{language_level}\x1f{normalize_query(question)}"
+
+    def _load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return
+        # Answers built from another index, prompt set or model are stale
+        if data.get("fingerprint") == self.fingerprint:
+            self.entries = data.get("entries", {})
+
+    def get(self, question, language_level):
+        return self.entries.get(self.key(question, language_level))
+
+    def put(self, question, language_level, answer, context):
+        self.entries[self.key(question, language_level)] = {"answer": answer, "context": context}
+
+    def save(self):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"fingerprint": self.fingerprint, "entries": self.entries}, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def __len__(self):
+        return len(self.entries)
+
+
+class SemanticAnswerCache:
+    """
+    Reuses answers for questions that mean the same ("will it hurt" / "is it painful").
+
+    Question embeddings are L2-normalised and kept in one small IndexFlatIP per
+    language level, so the inner product is the cosine similarity. A stored
+    answer is returned when the best match reaches `threshold`. Only answers
+    to opening questions are stored since they do not depend on a history.
+    With `path` set the cache is saved as <path>/semantic_cache.json + .npz.
+
+    Answers are shared across patients, so `threshold` has no default: bge
+    scores unrelated questions high, measure it with
+    `python -m Backend.answer_cache --measure_threshold` first.
+    """
+
+    def __init__(self, fingerprint, threshold, max_entries=2000, path=None, save_every=20):
+        self.fingerprint = fingerprint
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.path = path
+        self.save_every = save_every
+        self.indexes = {}
+        self.entries = {}
+        self._unsaved = 0
+        self._lock = threading.Lock()
+        if path:
+            self._load()
+
+    @staticmethod
+    def _normalize(vector):
+        vector = np.asarray(vector, dtype="float32").reshape(1, -1)
+        faiss.normalize_L2(vector)
+        return vector
+
+    def _index_for(self, language_level, dimensions):
+        if language_level not in self.indexes:
+            self.indexes[language_level] = faiss.IndexFlatIP(dimensions)
+            self.entries[language_level] = []
+        return self.indexes[language_level]
+
+    def lookup(self, vector, language_level):
+        """Returns (entry, similarity) of the closest stored question, or None below the threshold"""
+        with self._lock:
+            index = self.indexes.get(language_level)
+            if index is None or index.ntotal == 0:
+                return None
+            scores, ids = index.search(self._normalize(vector), 1)
+            score, idx = float(scores[0][0]), int(ids[0][0])
+            if idx < 0 or score < self.threshold:
+                return None
+            return self.entries[language_level][idx], score
+
+    def add(self, vector, language_level, question, answer, context):
+        vector = self._normalize(vector)
+        with self._lock:
+            index = self._index_for(language_level, vector.shape[1])
+            entries = self.entries[language_level]
+            if index.ntotal >= self.max_entries:
+                # Drop the oldest answer, IndexFlat shifts the remaining ids down
+                index.remove_ids(np.array([0], dtype="int64"))
+                entries.pop(0)
+            index.add(vector)
+            entries.append({"question": question, "answer": answer, "context": context})
+
+            self._unsaved += 1
+            if self.path and self._unsaved >= self.save_every:
+                self._save_locked()
+
+    def save(self):
+        with self._lock:
+            self._save_locked()
+
+    def _save_locked(self):
+        os.makedirs(self.path, exist_ok=True)
+        vectors = {level: index.reconstruct_n(0, index.ntotal) for level, index in self.indexes.items()}
+        np.savez(os.path.join(self.path, "semantic_cache.npz"), **vectors)
+        tmp_path = os.path.join(self.path, "semantic_cache.json.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"fingerprint": self.fingerprint, "entries": self.entries}, f)
+        os.replace(tmp_path, os.path.join(self.path, "semantic_cache.json"))
+        self._unsaved = 0
+
+    def _load(self):
+        try:
+            with open(os.path.join(self.path, "semantic_cache.json"), "r", encoding="utf-8") as f:
+                data = json.load(f)
+            vectors = np.load(os.path.join(self.path, "semantic_cache.npz"))
+        except (FileNotFoundError, json.JSONDecodeError):
+            return
+        # Answers from another index, prompt set or model are stale
+        if data.get("fingerprint") != self.fingerprint:
+            return
+        for level, entries in data.get("entries", {}).items():
+            if level not in vectors.files or len(vectors[level]) != len(entries):
+                continue
+            index = self._index_for(level, vectors[level].shape[1])
+            index.add(np.ascontiguousarray(vectors[level], dtype="float32"))
+            self.entries[level] = entries
+
+    def __len__(self):
+        return sum(len(entries) for entries in self.entries.values())
+
+
+def similarity_report(questions, vectors, top=10):
+    """
+    Cosine similarity of every pair of distinct questions, highest first, as [(similarity, q1, q2)].
+    A semantic cache threshold must stay above the pairs that need different answers.
+    """
+    vectors = np.ascontiguousarray(vectors, dtype="float32")
+    faiss.normalize_L2(vectors)
+    similarities = vectors @ vectors.T
+    pairs = [(float(similarities[i, j]), questions[i], questions[j])
+             for i in range(len(questions)) for j in range(i + 1, len(questions))
+             if normalize_query(questions[i]) != normalize_query(questions[j])]
+    return sorted(pairs, reverse=True)[:top]
+
+
+def warm_up_example_answers(rag_model, questions, language_levels, path):
+    """Generate and store the answer for every (example question, language level) pair"""
+    cache = ExampleAnswerCache(path, rag_model.answer_cache_fingerprint)
+    for language_level in language_levels:
+        for question in questions:
+            if cache.get(question, language_level) is not None:
+                continue
+            answer, context = rag_model.generate_first_turn_answer(question, language_level)
+            cache.put(question, language_level, answer, context)
+            print(f"✅ Cached answer [{language_level}] {question}")
+            # Save as we go, a crashed warm-up keeps what it already generated
+            cache.save()
+    return cache
+
+
+if __name__ == "__main__":
+    from Backend.rag_model import Ollama_RAG
+
+    parser = argparse.ArgumentParser(description="Precompute answers for the frontend example questions")
+    parser.add_argument("--model", type=str, default="mistral", help="Ollama model name")
+    parser.add_argument("--index_dir", type=str, default="meta_data/faiss_index")
+    parser.add_argument("--prompts", type=str, default="meta_data/prompts.yaml")
+    parser.add_argument("--frontend_text", type=str, default="Frontend/assets/frontend_text.yaml")
+    parser.add_argument("--output", type=str, default="meta_data/output/example_answers.json")
+    parser.add_argument("--measure_threshold", action="store_true",
+                        help="Only print the most similar pairs of distinct questions, to choose a semantic cache threshold")
+    parser.add_argument("--extra_questions", type=str, nargs="*", default=[],
+                        help="Near-miss questions to measure as well, e.g. 'Can I drink before the surgery?'")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    logger = logging.getLogger(__name__)
+
+    with open(args.frontend_text, "r", encoding="utf-8") as file:
+        frontend_text = yaml.safe_load(file)
+    questions = [q for topic in frontend_text["topic_questions"].values() for q in topic]
+
+    if args.measure_threshold:
+        from Backend.helpers import embedding_model
+
+        questions += args.extra_questions
+        # Same query embeddings as the cache lookups
+        vectors = [embedding_model().embed_query(question) for question in questions]
+        print(f"Most similar pairs of {len(questions)} distinct questions:")
+        for similarity, first, second in similarity_report(questions, vectors):
+            print(f"  {similarity:.3f}  '{first}' ~ '{second}'")
+        print("A semantic cache threshold has to be above every pair that needs a different answer.")
+        raise SystemExit(0)
+
+    with open(args.prompts, "r", encoding="cp1252") as file:
+        prompts = yaml.safe_load(file)
+    rag_model = Ollama_RAG(list(prompts.keys())[0], prompts, args.index_dir, args.model, logger)
+    cache = warm_up_example_answers(rag_model, questions, list(prompts.keys()), args.output)
+    print(f"Example answer cache holds {len(cache)} answers: {args.output}")
@@ -3,37 +3,110 @@ warnings.filterwarnings("ignore" )
 import os
 import numpy as np
 import json
+import faiss
 
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain.vectorstores import FAISS
 from langchain.embeddings import HuggingFaceEmbeddings
-from langchain.storage import InMemoryStore
 from langchain.retrievers import MultiVectorRetriever
+from langchain_core.documents import Document
 
-from Backend.helpers import pdf_text_extractor, pdf_table_extractor, pdf_image_extractor, create_vector_store
+from Backend.helpers import pdf_text_extractor, pdf_table_extractor, pdf_image_extractor, create_vector_store, EmbeddingEngine, INDEX_TYPES, chunk_doccument, choose_nlist, embedding_dimension
+from Backend.answer_cache import file_digest
+from Backend.sparse_index import BM25_FILES, LEGACY_BM25_FILES, build_sparse_index
+from Backend.index_store import (DOCSTORE_FILE, INDEX_FILE, LEGACY_DOCSTORE_FILE, PARENT_STORE_FILE, SQLiteDocumentStore,
+                                 active_index_dir, index_store_exists, load_index_store, new_index_version,
+                                 publish_index_version, save_index_store)
 
+import argparse
+import itertools
+import multiprocessing
+import shutil
+import uuid
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
 from pathlib import Path
 
 
+EMBEDDING_MODEL_NAME = "BAAI/bge-large-en-v1.5"
+MANIFEST_FILE = "manifest.json"
+# Raw float32 vectors while an index is built, removed before it is published
+EMBEDDINGS_FILE = "embeddings.f32"
 
-def create_vectorstore_from_pdfs(pdf_dir, index_dir, chunk_size=1000, chunk_overlap=200):
+
+
+def parse_pdf(pdf_dir, file, chunk_size=1000, chunk_overlap=200):
+    """
+    Worker task: hash one PDF, extract its sections and split them into child chunks.
+    Each child keeps the doc_id of its section and gets its own chunk_id.
+    """
+    text_docs, text_ids, texts = pdf_text_extractor(pdf_dir, file)
+    child_docs = chunk_doccument([doc.copy(deep=True) for doc in text_docs], chunk_size, chunk_overlap)
+    for child in child_docs:
+        child.metadata["chunk_id"] = str(uuid.uuid4())
+    return file, file_digest(os.path.join(pdf_dir, file)), text_docs, child_docs
+
+
+def iter_parsed_pdfs(pdf_dir, files, workers=None, max_pending=None, chunk_size=1000, chunk_overlap=200):
+    """
+    Parse PDFs in a process pool and yield (file, sha256, section_docs, child_docs) as they finish.
+
+    At most `max_pending` files are parsed or waiting to be consumed at any
+    time; a new file is only submitted once the consumer took a result, so a
+    slow embedder holds the parsers back instead of piling up documents.
+    """
+    workers = workers or os.cpu_count() or 1
+    max_pending = max_pending or 2 * workers
+    files = iter(files)
+    # Spawned, not forked: at startup this runs in the model loader thread next to the
+    # web server and heartbeat threads, a fork could copy a lock one of them holds
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        pending = set()
+        for file in itertools.islice(files, max_pending):
+            pending.add(pool.submit(parse_pdf, pdf_dir, file, chunk_size, chunk_overlap))
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+                for file in itertools.islice(files, 1):
+                    pending.add(pool.submit(parse_pdf, pdf_dir, file, chunk_size, chunk_overlap))
+
+
+def create_vectorstore_from_pdfs(pdf_dir, index_dir, chunk_size=1000, chunk_overlap=200, workers=None, max_pending=None,
+                                 batch_size=32, index_type="ivf_flat"):
     combined_text_docs = []
     combined_text_ids = []
     combined_text = []
     combined_table_docs = []
     combined_table_ids = []
     combined_tables = []
+    manifest_files = {}
+    all_docs = []
 
-    # Load the pdf documents
-    for file in os.listdir(pdf_dir):
-        if not file.endswith(".pdf"):
-            continue
+    # The embedder consumes parsed PDFs while the next ones are still being parsed
+    print("\nCreating an embedding model\n")
+    embedding = HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL_NAME)
+    engine = EmbeddingEngine(embedding, batch_size=batch_size)
+    dimensions = embedding_dimension(embedding)
+
+    # Vectors of each PDF are appended to one raw float32 file and read back as a single
+    # memmap, the corpus is never held twice (per-PDF batches plus the stacked matrix)
+    version_dir = new_index_version(index_dir)
+    vectors_path = os.path.join(version_dir, EMBEDDINGS_FILE)
 
-        print(f"\n📄 Processing PDF: {file}")
-        text_docs, text_ids, texts = pdf_text_extractor(pdf_dir, file)
-        combined_text.extend(texts)
+    # Load the pdf documents
+    pdf_files = sorted(f for f in os.listdir(pdf_dir) if f.endswith(".pdf"))
+    parsed = iter_parsed_pdfs(pdf_dir, pdf_files, workers, max_pending, chunk_size, chunk_overlap)
+    for file, sha256, text_docs, child_docs in parsed:
+        print(f"\n📄 Processed PDF: {file}")
+        text_ids = [doc.metadata["doc_id"] for doc in text_docs]
+        combined_text.extend(doc.page_content for doc in text_docs)
         combined_text_ids.extend(text_ids)
         combined_text_docs.extend(text_docs)
+        manifest_files[file] = {
+            "sha256": sha256,
+            "chunk_ids": [child.metadata["chunk_id"] for child in child_docs],
+            "parent_ids": text_ids,
+        }
 
         # table_docs, table_ids, tables = pdf_table_extractor(model, pdf_dir, file)
         # combined_tables.extend(tables)
@@ -43,50 +116,237 @@ def create_vectorstore_from_pdfs(pdf_dir, index_dir, chunk_size=1000, chunk_over
         #images = pdf_image_extractor(pdf_dir,file, output_dir="/Users/NithishChowdary1/Desktop/Workspace/Innovate-a-thon/doc-chat/data/Images")
         #all_docs_images.extend(images)
 
-        print("completed")
+        # Embed every chunk exactly once, the same matrix trains the IVF index and is added to it
+        if child_docs:
+            all_docs.extend(child_docs)
+            vectors = engine.embed([child.page_content for child in child_docs])
+            with open(vectors_path, "ab") as f:
+                vectors.tofile(f)
+
         print("Succesfully loaded pdf doccument")
 
     print(f"Loaded available pdf documents")
-    all_docs = combined_table_docs + combined_text_docs
 
-    # Embed the chunks into vector stores
-    print("\nCreating an embedding model\n")
-    embedding = HuggingFaceEmbeddings(model_name="BAAI/bge-large-en-v1.5")
+    texts = [doc.page_content for doc in all_docs]
+    embeddings = np.memmap(vectors_path, dtype="float32", mode="r", shape=(len(texts), dimensions))
 
-    vectorstore = create_vector_store(embeddings_model=embedding, n_list=5)
-    docstore = InMemoryStore()
+    # IVF list count is sized from the corpus, see build_faiss_index for the index types
+    vectorstore = create_vector_store(embeddings_model=embedding, index_type=index_type,
+                                      n_vectors=len(embeddings), dimensions=dimensions)
+    # Full sections go to a SQLite store next to the index, child chunk hits resolve to them at serve time
+    docstore = SQLiteDocumentStore(os.path.join(version_dir, PARENT_STORE_FILE))
 
     retriever = MultiVectorRetriever(
         vectorstore = vectorstore,
         docstore = docstore,
         id_key="doc_id"
     )
-    embeddings = embedding.embed_documents([doc.page_content for doc in all_docs])
-    embeddings = np.array(embeddings).astype("float32")
-    retriever.vectorstore.index.train(embeddings)
-    retriever.vectorstore.index.nprobe = 2
+    if not retriever.vectorstore.index.is_trained:
+        retriever.vectorstore.index.train(embeddings)
 
-    retriever.vectorstore.add_documents(combined_text_docs)
-    retriever.docstore.mset(list(zip(combined_text_ids, combined_text)))
+    # IVF indexes take the memmap as is, no list of per-row pairs
+    add_vectors(retriever.vectorstore, texts, embeddings, [doc.metadata for doc in all_docs],
+                [doc.metadata["chunk_id"] for doc in all_docs])
+    retriever.docstore.mset(list(zip(combined_text_ids, combined_text_docs)))
+    del embeddings
+    os.remove(vectors_path)
 
 
     # Save the vector store for later use
-    if index_dir:
-        retriever.vectorstore.save_local(index_dir)
-        print(f"Vector store saved to: {index_dir}")
+    save_vectorstore_atomic(retriever.vectorstore, index_dir, version_dir, manifest_files)
+    print(f"Vector store saved to: {index_dir}")
+
+def load_manifest(index_dir):
+    try:
+        with open(os.path.join(active_index_dir(index_dir), MANIFEST_FILE), "r", encoding="utf-8") as f:
+            return json.load(f)["files"]
+    except (FileNotFoundError, json.JSONDecodeError, KeyError):
+        return None
+
+
+def save_vectorstore_atomic(vectorstore, index_dir, version_dir, manifest_files):
+    """
+    Write index, docstore, BM25 index and manifest into the new `version_dir`,
+    then publish it with a single rename of CURRENT. A crash before that
+    leaves the live version untouched, the next sync redoes the work.
+    """
+    # The parent store was already written into the version directory by the caller
+    save_index_store(vectorstore, version_dir)
+    # BM25 statistics depend on the whole corpus, the sparse index is rebuilt on every save
+    build_sparse_index(vectorstore).save(version_dir)
+    with open(os.path.join(version_dir, MANIFEST_FILE), "w", encoding="utf-8") as f:
+        json.dump({"embedding_model": EMBEDDING_MODEL_NAME, "files": manifest_files}, f, indent=2)
+    publish_index_version(index_dir, version_dir)
+
+    # Files of the unversioned layout (and the pickled docstore before it) are superseded
+    for name in [INDEX_FILE, DOCSTORE_FILE, LEGACY_DOCSTORE_FILE, PARENT_STORE_FILE, *BM25_FILES, *LEGACY_BM25_FILES,
+                 MANIFEST_FILE]:
+        if os.path.exists(os.path.join(index_dir, name)):
+            os.remove(os.path.join(index_dir, name))
+    shutil.rmtree(os.path.join(index_dir, ".staging"), ignore_errors=True)
+
+
+def manifest_from_docstore(vectorstore):
+    """Rebuild the file -> chunk ids mapping for indexes created before the manifest existed"""
+    files = {}
+    for chunk_id in vectorstore.index_to_docstore_id.values():
+        doc = vectorstore.docstore.search(chunk_id)
+        file = doc.metadata.get("file_name")
+        # No hash recorded, the file counts as changed and is re-embedded once
+        entry = files.setdefault(file, {"sha256": None, "chunk_ids": [], "parent_ids": []})
+        entry["chunk_ids"].append(chunk_id)
+        if doc.metadata.get("doc_id") not in entry["parent_ids"]:
+            entry["parent_ids"].append(doc.metadata.get("doc_id"))
+    return files
+
+
+def remove_vectors(vectorstore, chunk_ids):
+    """
+    Remove chunks from the index, docstore and position map.
+
+    Flat indexes shift the remaining vectors down on remove_ids, which is how
+    FAISS.delete renumbers its map. IVF indexes keep the ids of the remaining
+    vectors, so their map entries are dropped without renumbering.
+    """
+    if faiss.try_extract_index_ivf(vectorstore.index) is None:
+        vectorstore.delete(ids=chunk_ids)
+        return
+    stale = set(chunk_ids)
+    labels = [label for label, chunk_id in vectorstore.index_to_docstore_id.items() if chunk_id in stale]
+    vectorstore.index.remove_ids(np.array(labels, dtype="int64"))
+    for label in labels:
+        del vectorstore.index_to_docstore_id[label]
+    vectorstore.docstore.delete(list(stale))
+
+
+def add_vectors(vectorstore, texts, embeddings, metadatas, chunk_ids):
+    """
+    Add embedded chunks. IVF indexes get explicit ids above the largest one in
+    use, after a removal the vector count no longer points past every stored id.
+    """
+    if faiss.try_extract_index_ivf(vectorstore.index) is None:
+        vectorstore.add_embeddings(text_embeddings=list(zip(texts, embeddings)), metadatas=metadatas, ids=chunk_ids)
+        return
+    start = max(vectorstore.index_to_docstore_id, default=-1) + 1
+    labels = np.arange(start, start + len(texts), dtype="int64")
+    vectorstore.index.add_with_ids(np.asarray(embeddings, dtype="float32"), labels)
+    vectorstore.docstore.add({chunk_id: Document(page_content=text, metadata=metadata)
+                              for chunk_id, text, metadata in zip(chunk_ids, texts, metadatas)})
+    vectorstore.index_to_docstore_id.update(zip(labels.tolist(), chunk_ids))
+
+
+def nlist_drifted(index, max_drift=2.0):
+    """True when an IVF index has more than `max_drift` times too many or too few lists for its size"""
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is None:
+        return False
+    expected = choose_nlist(index.ntotal)
+    return not expected / max_drift <= ivf.nlist <= expected * max_drift
+
+
+def sync_vectorstore(pdf_dir, index_dir, chunk_size=1000, chunk_overlap=200, workers=None, max_pending=None,
+                     batch_size=32, index_type="ivf_flat"):
+    """
+    Bring the index in line with the PDFs in `pdf_dir`.
+
+    Only new or changed files (by content hash) are parsed and embedded, the
+    vectors of changed or deleted files are removed with FAISS remove_ids
+    (see remove_vectors for how the position map is kept in line).
+    Without an index, or once the IVF list count no longer fits the corpus,
+    a full build is done. Returns the number of changed files.
+    """
+    pdf_files = sorted(f for f in os.listdir(pdf_dir) if f.endswith(".pdf"))
+    rebuild_kwargs = dict(chunk_size=chunk_size, chunk_overlap=chunk_overlap, workers=workers,
+                          max_pending=max_pending, batch_size=batch_size, index_type=index_type)
+    live_dir = active_index_dir(index_dir)
+    live_parent_path = os.path.join(live_dir, PARENT_STORE_FILE)
+    # Indexes from before the parent store held whole sections as vectors, they are rebuilt once
+    if not index_store_exists(live_dir) or not os.path.exists(live_parent_path):
+        create_vectorstore_from_pdfs(pdf_dir, index_dir, **rebuild_kwargs)
+        return len(pdf_files)
+
+    current = {file: file_digest(os.path.join(pdf_dir, file)) for file in pdf_files}
+    manifest = load_manifest(index_dir)
+    if manifest is not None:
+        changed = [f for f in pdf_files if f not in manifest or manifest[f]["sha256"] != current[f]]
+        deleted = [f for f in manifest if f not in current]
+        if not changed and not deleted:
+            print("✅ Vector store is up to date")
+            return 0
+
+    embedding = HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL_NAME)
+    engine = EmbeddingEngine(embedding, batch_size=batch_size)
+    vectorstore = load_index_store(live_dir, embedding, read_only=False)
+    if manifest is None:
+        manifest = manifest_from_docstore(vectorstore)
+        changed = [f for f in pdf_files if f not in manifest or manifest[f]["sha256"] != current[f]]
+        deleted = [f for f in manifest if f not in current]
+
+    # Remove the vectors of changed and deleted files
+    stored_ids = set(vectorstore.index_to_docstore_id.values())
+    stale_ids = [chunk_id for f in changed + deleted if f in manifest
+                 for chunk_id in manifest[f]["chunk_ids"] if chunk_id in stored_ids]
+    if stale_ids:
+        try:
+            remove_vectors(vectorstore, stale_ids)
+        except RuntimeError as e:
+            # e.g. HNSW indexes do not implement remove_ids
+            print(f"⚠️ Index cannot remove vectors ({e}), rebuilding it")
+            create_vectorstore_from_pdfs(pdf_dir, index_dir, **rebuild_kwargs)
+            return len(changed) + len(deleted)
+    # Work on a copy of the parent store, it is published together with the index
+    version_dir = new_index_version(index_dir)
+    parent_path = os.path.join(version_dir, PARENT_STORE_FILE)
+    shutil.copyfile(live_parent_path, parent_path)
+    parent_store = SQLiteDocumentStore(parent_path)
+    parent_store.mdelete([parent_id for f in changed + deleted if f in manifest
+                          for parent_id in manifest[f].get("parent_ids", [])])
+    for file in deleted:
+        print(f"🗑️ Removed '{file}' from the vector store")
+        manifest.pop(file)
 
-        # doc_dict = dict(zip(combined_text_ids + combined_table_ids, combined_text + combined_tables))
-        # with open(os.path.join(index_dir, "docstore_proto.json"), "w") as f:
-        #     json.dump(doc_dict, f)
+    # Embed only the new and changed files
+    parsed = iter_parsed_pdfs(pdf_dir, changed, workers, max_pending, chunk_size, chunk_overlap)
+    for file, sha256, text_docs, child_docs in parsed:
+        print(f"\n📄 Processed PDF: {file}")
+        chunk_ids = [child.metadata["chunk_id"] for child in child_docs]
+        if child_docs:
+            texts = [child.page_content for child in child_docs]
+            embeddings = engine.embed(texts)
+            add_vectors(vectorstore, texts, embeddings, [child.metadata for child in child_docs], chunk_ids)
+        text_ids = [doc.metadata["doc_id"] for doc in text_docs]
+        parent_store.mset(list(zip(text_ids, text_docs)))
+        manifest[file] = {"sha256": sha256, "chunk_ids": chunk_ids, "parent_ids": text_ids}
 
-# if __name__ == "__main__":
-#
-#     ROOT_DIR = Path(__file__).resolve().parents[2]
-#     DATA_DIR = os.path.join(ROOT_DIR, "doc-chat/data")
-#     INDEX_DIR = "faiss_index"
-#
-#     create_vectorstore_from_pdfs(str(DATA_DIR), INDEX_DIR)
+    # nlist is sized at a full build, a corpus that grew (or shrank) a lot needs new lists
+    if nlist_drifted(vectorstore.index):
+        print(f"⚠️ {faiss.extract_index_ivf(vectorstore.index).nlist} IVF lists do not fit "
+              f"{vectorstore.index.ntotal} vectors (about {choose_nlist(vectorstore.index.ntotal)} would), rebuilding")
+        shutil.rmtree(version_dir, ignore_errors=True)
+        create_vectorstore_from_pdfs(pdf_dir, index_dir, **rebuild_kwargs)
+        return len(changed) + len(deleted)
 
+    save_vectorstore_atomic(vectorstore, index_dir, version_dir, manifest)
+    print(f"✅ Vector store synced: {len(changed)} new or changed, {len(deleted)} removed")
+    return len(changed) + len(deleted)
 
 
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build or update the FAISS vector store from the PDFs")
+    parser.add_argument("--pdf_dir", type=str, default="data")
+    parser.add_argument("--index_dir", type=str, default="meta_data/faiss_index")
+    parser.add_argument("--rebuild", action="store_true", help="Rebuild the index from scratch instead of syncing")
+    parser.add_argument("--workers", type=int, default=None, help="PDF parser processes, default: one per core")
+    parser.add_argument("--batch_size", type=int, default=32, help="Chunks per embedding batch")
+    parser.add_argument("--chunk_size", type=int, default=1000, help="Characters per child chunk")
+    parser.add_argument("--chunk_overlap", type=int, default=200)
+    parser.add_argument("--index_type", type=str, default="ivf_flat", choices=INDEX_TYPES,
+                        help="FAISS index, compare them with python -m Backend.index_benchmark")
+    args = parser.parse_args()
 
+    build_kwargs = dict(chunk_size=args.chunk_size, chunk_overlap=args.chunk_overlap, workers=args.workers,
+                        batch_size=args.batch_size, index_type=args.index_type)
+    if args.rebuild:
+        create_vectorstore_from_pdfs(args.pdf_dir, args.index_dir, **build_kwargs)
+    else:
+        sync_vectorstore(args.pdf_dir, args.index_dir, **build_kwargs)
@@ -0,0 +1,173 @@
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from langchain_core.embeddings import Embeddings
+
+
+class PooledEmbeddings(Embeddings):
+    """
+    Runs the async embedding calls of a sync embedder on a small, fixed thread pool.
+
+    LangChain's default `aembed_query` hands the work to the unbounded default
+    executor; with a CPU-bound model like BGE that only makes concurrent
+    requests fight for the same cores. The sync calls are passed through.
+    """
+
+    def __init__(self, embeddings, max_workers=2):
+        self.embeddings = embeddings
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="embedding")
+
+    def embed_documents(self, texts):
+        return self.embeddings.embed_documents(texts)
+
+    def embed_query(self, text):
+        return self.embeddings.embed_query(text)
+
+    async def aembed_documents(self, texts):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, self.embeddings.embed_documents, texts)
+
+    async def aembed_query(self, text):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, self.embeddings.embed_query, text)
+
+
+def normalize_query(text):
+    """Cache key for a query: case and whitespace differences do not matter"""
+    return " ".join(text.lower().split())
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    LRU/TTL cache for query embeddings with an optional SQLite tier on disk.
+
+    Only `embed_query` is cached, documents are embedded once at ingestion
+    anyway. Example questions from the frontend are asked over and over and
+    never reach the encoder after their first use.
+    """
+
+    def __init__(self, embeddings, model_name="", max_size=1024, ttl_seconds=None, cache_path=None):
+        self.embeddings = embeddings
+        self.model_name = model_name
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+        self._db = None
+        if cache_path:
+            os.makedirs(os.path.dirname(cache_path) or ".", exist_ok=True)
+            self._db = sqlite3.connect(cache_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS query_embeddings "
+                "(model TEXT, query TEXT, vector BLOB, PRIMARY KEY (model, query))"
+            )
+            self._db.commit()
+
+    def stats(self):
+        lookups = self.hits + self.disk_hits + self.misses
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+            "size": len(self._cache),
+        }
+
+    def _lookup(self, key):
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is not None:
+                vector, stored_at = entry
+                if self.ttl_seconds is None or time.monotonic() - stored_at < self.ttl_seconds:
+                    self._cache.move_to_end(key)
+                    self.hits += 1
+                    return vector
+                del self._cache[key]
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT vector FROM query_embeddings WHERE model = ? AND query = ?",
+                    (self.model_name, key),
+                ).fetchone()
+                if row is not None:
+                    vector = array("f", row[0]).tolist()
+                    self._remember(key, vector)
+                    self.disk_hits += 1
+                    return vector
+
+            self.misses += 1
+            return None
+
+    def _remember(self, key, vector):
+        self._cache[key] = (vector, time.monotonic())
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.max_size:
+            self._cache.popitem(last=False)
+
+    def _store(self, key, vector):
+        with self._lock:
+            self._remember(key, vector)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO query_embeddings (model, query, vector) VALUES (?, ?, ?)",
+                    (self.model_name, key, array("f", vector).tobytes()),
+                )
+                self._db.commit()
+
+    def embed_documents(self, texts):
+        return self.embeddings.embed_documents(texts)
+
+    def embed_query(self, text):
+        key = normalize_query(text)
+        vector = self._lookup(key)
+        if vector is None:
+            vector = self.embeddings.embed_query(text)
+            self._store(key, vector)
+        return vector
+
+    def _missing_indices(self, keys):
+        vectors = [self._lookup(key) for key in keys]
+        return vectors, [i for i, vector in enumerate(vectors) if vector is None]
+
+    def embed_queries(self, texts):
+        """
+        Embed several queries with one batched encoder call, cached queries are skipped.
+        HuggingFaceEmbeddings encodes queries and documents the same way.
+        """
+        keys = [normalize_query(text) for text in texts]
+        vectors, missing = self._missing_indices(keys)
+        if missing:
+            for i, vector in zip(missing, self.embeddings.embed_documents([texts[i] for i in missing])):
+                vectors[i] = vector
+                self._store(keys[i], vector)
+        return vectors
+
+    async def aembed_queries(self, texts):
+        keys = [normalize_query(text) for text in texts]
+        vectors, missing = self._missing_indices(keys)
+        if missing:
+            for i, vector in zip(missing, await self.embeddings.aembed_documents([texts[i] for i in missing])):
+                vectors[i] = vector
+                self._store(keys[i], vector)
+        return vectors
+
+    async def aembed_documents(self, texts):
+        return await self.embeddings.aembed_documents(texts)
+
+    async def aembed_query(self, text):
+        key = normalize_query(text)
+        vector = self._lookup(key)
+        if vector is None:
+            vector = await self.embeddings.aembed_query(text)
+            self._store(key, vector)
+        return vector
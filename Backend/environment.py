@@ -0,0 +1,114 @@
+"""
+Checks that the packages in requirements.txt are installed, once per environment.
+
+The check is remembered as a fingerprint of requirements.txt and the
+interpreter. Starting again with the same fingerprint only hashes the file,
+without looking up any module. When requirements.txt changes or a different
+Python runs the app, the distributions are checked again in parallel and only
+the missing ones are installed.
+
+    python -m Backend.environment            # verify, install what is missing
+    python -m Backend.environment --force    # ignore the stored fingerprint
+"""
+import argparse
+import hashlib
+import json
+import os
+import re
+import subprocess
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+
+REQUIREMENTS_FILE = "requirements.txt"
+FINGERPRINT_FILE = "meta_data/output/environment_fingerprint.json"
+
+
+def requirement_names(requirements_file=REQUIREMENTS_FILE):
+    """Distribution names in a requirements file, options, comments and version pins removed"""
+    names = []
+    with open(requirements_file, encoding="utf-8") as f:
+        for line in f:
+            line = line.split("#", 1)[0].strip()
+            if not line or line.startswith("-"):
+                continue
+            match = re.match(r"[A-Za-z0-9][A-Za-z0-9._-]*", line)
+            if match:
+                names.append(match.group(0))
+    return names
+
+
+def environment_fingerprint(requirements_file=REQUIREMENTS_FILE):
+    """Hash of the requirements and the interpreter that has to satisfy them"""
+    digest = hashlib.sha256()
+    with open(requirements_file, "rb") as f:
+        digest.update(f.read())
+    digest.update(sys.executable.encode("utf-8"))
+    digest.update(sys.version.encode("utf-8"))
+    return digest.hexdigest()
+
+
+def load_fingerprint(path=FINGERPRINT_FILE):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f).get("fingerprint")
+    except (OSError, ValueError):
+        return None
+
+
+def save_fingerprint(fingerprint, packages, path=FINGERPRINT_FILE):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"fingerprint": fingerprint, "python": sys.executable, "packages": packages}, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def is_installed(name):
+    # Distribution metadata, not find_spec: faiss-cpu is imported as faiss, PyMuPDF as fitz
+    from importlib.metadata import PackageNotFoundError, distribution
+
+    try:
+        distribution(name)
+        return True
+    except PackageNotFoundError:
+        return False
+
+
+def missing_requirements(names, workers=8):
+    """Names of the distributions that are not installed, looked up in parallel"""
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        installed = list(executor.map(is_installed, names))
+    return [name for name, ok in zip(names, installed) if not ok]
+
+
+def ensure_requirements(requirements_file=REQUIREMENTS_FILE, fingerprint_file=FINGERPRINT_FILE, force=False):
+    """Install missing requirements, skipped entirely while the environment fingerprint is unchanged"""
+    fingerprint = environment_fingerprint(requirements_file)
+    if not force and load_fingerprint(fingerprint_file) == fingerprint:
+        return []
+
+    names = requirement_names(requirements_file)
+    missing = missing_requirements(names)
+    if missing:
+        print(f"Installing missing packages: {', '.join(missing)}")
+        # The running interpreter's pip, a bare `pip` may belong to another environment
+        subprocess.check_call([sys.executable, "-m", "pip", "install", *missing])
+        still_missing = missing_requirements(missing)
+        if still_missing:
+            # No fingerprint, the next start checks again
+            print(f"⚠️ Still missing after pip install: {', '.join(still_missing)}")
+            return missing
+    save_fingerprint(fingerprint, names, fingerprint_file)
+    print("✅ Requirements verified")
+    return missing
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Verify the installed requirements and remember the environment")
+    parser.add_argument("--requirements", type=str, default=REQUIREMENTS_FILE)
+    parser.add_argument("--fingerprint_file", type=str, default=FINGERPRINT_FILE)
+    parser.add_argument("--force", action="store_true", help="Verify even if the fingerprint is unchanged")
+    args = parser.parse_args()
+
+    ensure_requirements(args.requirements, args.fingerprint_file, force=args.force)
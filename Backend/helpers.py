@@ -1,31 +1,35 @@
 import warnings
 warnings.filterwarnings("ignore" )
 import os
+import math
+import time
 import uuid
 
 import io
 import base64
 import faiss
-import torch
-import pdfplumber
+import numpy as np
 
 from langchain.embeddings import HuggingFaceEmbeddings
-from transformers import pipeline
 import subprocess
 from io import BytesIO
-from PIL import  Image
-from langchain.document_loaders import UnstructuredPDFLoader
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_community.docstore.in_memory import InMemoryDocstore
 from langchain_community.vectorstores import FAISS
 from langchain.schema import Document
-from transformers import BlipProcessor, BlipForConditionalGeneration
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
 
+from Backend.readiness import ollama_has_model
+
+# torch, transformers, pdfplumber, fitz, PIL and unstructured are imported inside the
+# functions that need them: they are only used at ingestion, serving never loads them
+
 
 
 def pdf_text_extractor(pdf_dir, file):
+    from langchain.document_loaders import UnstructuredPDFLoader
+
     document_loader = UnstructuredPDFLoader(os.path.join(pdf_dir, file), mode="elements", strategy="fast")
     docs = document_loader.load()
     current_title = ""
@@ -74,6 +78,8 @@ def pdf_text_extractor(pdf_dir, file):
 
 
 def pdf_table_extractor(model, pdf_dir, file):
+    import pdfplumber
+
     table_docs = []
     table_ids = []
     tables = []
@@ -108,6 +114,9 @@ def pdf_table_extractor(model, pdf_dir, file):
 
 
 def pdf_image_extractor(pdf_dir, file, output_dir:str):
+    import fitz
+    from PIL import Image
+
     doc = fitz.open(os.path.join(pdf_dir,file))
     base_name = os.path.splitext(file)[0]
     image_docs = []
@@ -173,6 +182,8 @@ def get_images_base64(chunks):
     return img_base64
 
 def vision_model(model_name: str = "Salesforce/blip-image-captioning-base"):
+    from transformers import BlipProcessor, BlipForConditionalGeneration
+
     processor = BlipProcessor.from_pretrained(model_name)
     model = BlipForConditionalGeneration.from_pretrained(model_name)
 
@@ -180,6 +191,9 @@ def vision_model(model_name: str = "Salesforce/blip-image-captioning-base"):
 
 
 def summarise_images(img):
+    import torch
+    from PIL import Image
+
     try:
         image = Image.open(img).convert("RGB")
 
@@ -216,6 +230,7 @@ def table_to_html(table):
     return html
 
 def encode_image_base64(img):
+    from PIL import Image
 
     with Image.open(img) as img:
         buffered = BytesIO()
@@ -246,10 +261,83 @@ def table_to_html(table):
     return html
 
 
-def create_vector_store(embeddings_model, n_list:int=10):
-    dimensions = len(embeddings_model.embed_query("hello world"))
-    quantizer = faiss.IndexFlatL2(dimensions)
-    index = faiss.IndexIVFFlat(quantizer, dimensions,n_list, faiss.METRIC_L2 )
+def embedding_dimension(embeddings_model):
+    """Vector size of the model, read from the sentence-transformers config when available"""
+    client = getattr(embeddings_model, "client", None)
+    if client is not None and hasattr(client, "get_sentence_embedding_dimension"):
+        dimensions = client.get_sentence_embedding_dimension()
+        if dimensions:
+            return dimensions
+    # Fallback for other embedding backends
+    return len(embeddings_model.embed_query("hello world"))
+
+
+INDEX_TYPES = ["flat", "hnsw", "ivf_flat", "ivf_sq8", "ivf_pq"]
+
+
+def choose_nlist(n_vectors):
+    """
+    Number of IVF lists for a corpus: about 4*sqrt(n), but with at least
+    39 training vectors per list (FAISS warns below that).
+    """
+    return max(1, min(int(4 * math.sqrt(n_vectors)), n_vectors // 39))
+
+
+def choose_nprobe(nlist):
+    return min(nlist, max(2, nlist // 8))
+
+
+def build_faiss_index(index_type, dimensions, n_vectors=None, n_list=None, nprobe=None, pq_m=None, hnsw_m=32):
+    """
+    FAISS index factory.
+
+    flat      exact search, 4 bytes per dimension
+    hnsw      graph index, fast and accurate, most memory, no remove_ids
+    ivf_flat  inverted lists over full vectors
+    ivf_sq8   inverted lists over 8-bit scalar quantized vectors (4x smaller)
+    ivf_pq    inverted lists over product quantized codes (`pq_m` bytes per vector)
+
+    IVF indexes pick `n_list` from `n_vectors` unless given and must be trained.
+    """
+    if index_type == "flat":
+        return faiss.IndexFlatL2(dimensions)
+
+    if index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dimensions, hnsw_m)
+        index.hnsw.efConstruction = 80
+        index.hnsw.efSearch = 64
+        return index
+
+    if n_list is None:
+        if n_vectors is None:
+            raise ValueError(f"'{index_type}' needs n_list or n_vectors to size the inverted lists")
+        n_list = choose_nlist(n_vectors)
+
+    if index_type == "ivf_flat":
+        quantizer = faiss.IndexFlatL2(dimensions)
+        index = faiss.IndexIVFFlat(quantizer, dimensions, n_list, faiss.METRIC_L2)
+    elif index_type == "ivf_sq8":
+        index = faiss.index_factory(dimensions, f"IVF{n_list},SQ8", faiss.METRIC_L2)
+    elif index_type == "ivf_pq":
+        # 16 dimensions per sub-quantizer, fewer centroids when there is little training data
+        pq_m = pq_m or max(1, dimensions // 16)
+        while dimensions % pq_m:
+            pq_m -= 1
+        n_bits = 8 if n_vectors is None else max(4, min(8, int(math.log2(max(n_vectors, 1) / 39))))
+        index = faiss.index_factory(dimensions, f"IVF{n_list},PQ{pq_m}x{n_bits}", faiss.METRIC_L2)
+    else:
+        raise ValueError(f"Unknown index type '{index_type}', choose from {INDEX_TYPES}")
+
+    faiss.extract_index_ivf(index).nprobe = nprobe or choose_nprobe(n_list)
+    return index
+
+
+def create_vector_store(embeddings_model, n_list=None, dimensions=None, index_type="ivf_flat", n_vectors=None, nprobe=None):
+    if dimensions is None:
+        dimensions = embedding_dimension(embeddings_model)
+    if index_type == "ivf_flat" and n_list is None and n_vectors is None:
+        n_list = 10
+    index = build_faiss_index(index_type, dimensions, n_vectors=n_vectors, n_list=n_list, nprobe=nprobe)
 
     vector_store = FAISS(
         embedding_function=embeddings_model,
@@ -260,6 +348,73 @@ def create_vector_store(embeddings_model, n_list:int=10):
     return vector_store
 
 
+class EmbeddingEngine:
+    """
+    Batched document embedding for ingestion.
+
+    Chunks are sorted by token length (longest first, so an out-of-memory
+    batch shows up immediately) and grouped into batches of at most
+    `batch_size` chunks and `max_batch_tokens` padded tokens, so short
+    sections are not padded to the length of long ones. Vectors are written
+    straight into one float32 matrix instead of a list of Python float lists.
+    """
+
+    def __init__(self, embeddings_model, batch_size=32, max_batch_tokens=16384, log_every=20):
+        self.embeddings_model = embeddings_model
+        self.batch_size = batch_size
+        self.max_batch_tokens = max_batch_tokens
+        self.log_every = log_every
+        self.client = getattr(embeddings_model, "client", None)
+        self.encode_kwargs = getattr(embeddings_model, "encode_kwargs", {}) or {}
+
+    def _token_lengths(self, texts):
+        tokenizer = getattr(self.client, "tokenizer", None)
+        if tokenizer is None:
+            return [len(text) // 4 + 1 for text in texts]
+        max_length = getattr(self.client, "max_seq_length", None) or 512
+        encoded = tokenizer(texts, add_special_tokens=True, truncation=True, max_length=max_length)
+        return [len(ids) for ids in encoded["input_ids"]]
+
+    def _batches(self, lengths):
+        order = sorted(range(len(lengths)), key=lambda i: lengths[i], reverse=True)
+        batch = []
+        for i in order:
+            # Sorted longest first, the first chunk of a batch sets its padded length
+            padded = lengths[batch[0]] if batch else lengths[i]
+            if batch and (len(batch) >= self.batch_size or padded * (len(batch) + 1) > self.max_batch_tokens):
+                yield batch
+                batch = []
+            batch.append(i)
+        if batch:
+            yield batch
+
+    def _encode(self, texts):
+        if self.client is not None and hasattr(self.client, "encode"):
+            import torch
+
+            with torch.inference_mode():
+                return self.client.encode(texts, batch_size=len(texts), convert_to_numpy=True,
+                                          show_progress_bar=False, **self.encode_kwargs)
+        return np.asarray(self.embeddings_model.embed_documents(texts), dtype="float32")
+
+    def embed(self, texts):
+        """Embed `texts`, returns an (n, dim) float32 array in the original order"""
+        out = np.empty((len(texts), embedding_dimension(self.embeddings_model)), dtype="float32")
+
+        start = time.perf_counter()
+        done = 0
+        for n_batch, batch in enumerate(self._batches(self._token_lengths(texts)), start=1):
+            out[batch] = self._encode([texts[i] for i in batch])
+            done += len(batch)
+            if n_batch % self.log_every == 0:
+                print(f"  Embedded {done}/{len(texts)} chunks ({done / (time.perf_counter() - start):.1f} chunks/sec)")
+
+        elapsed = time.perf_counter() - start
+        if texts:
+            print(f"✅ Embedded {len(texts)} chunks in {elapsed:.1f}s ({len(texts) / max(elapsed, 1e-9):.1f} chunks/sec)")
+        return out
+
+
 def summarise_chain(model):
     prompt = """
     You are a helpful assistant. Your task is to read the following content (which may be a table or a section of text) and generate a concise and informative summary.
@@ -279,27 +434,50 @@ def summarise_chain(model):
     return chain
 
 
+def conversation_summary_chain(model):
+    prompt = """
+    You are a helpful assistant. Your task is to keep a running summary of a conversation between a patient and a medical assistant.
+
+    Update the current summary with the new conversation turns. Keep names of drugs, procedures, dosages and any personal details the patient gave.
+
+    respond only with the updated summary, no additional comment 
+
+    Current summary: {summary}
+
+    New conversation turns: {conversation}
+    """
+
+    prompt = ChatPromptTemplate.from_template(prompt)
+    chain = prompt | model | StrOutputParser()
+
+    return chain
+
+
 def embedding_model(model_name="BAAI/bge-large-en-v1.5"):
 
     return HuggingFaceEmbeddings(model_name=model_name)
 
 
-def reranking_model(model_name="BAAI/bge-reranker-large", top_k=5):
+def reranking_model(model_name="BAAI/bge-reranker-large", top_k=5, device=None):
+    import torch
+    from transformers import pipeline
 
-    # Initialize the bge-reranker-large model once
+    # Initialize the bge-reranker-large model once, on the GPU when there is one
+    if device is None:
+        device = 0 if torch.cuda.is_available() else -1
     reranker = pipeline(
         "text-classification",
         model=model_name,
         top_k=top_k,
-        device=0  # Set to 0 if using CUDA (GPU)
+        device=device
     )
 
     return  reranker
 
 
-def is_model_available(model_name):
-    result = subprocess.run(["ollama", "list"], capture_output=True, text=True)
-    return model_name in result.stdout
+def is_model_available(model_name, host=None):
+    # Ask the Ollama HTTP API instead of shelling out to `ollama list`
+    return ollama_has_model(host or os.getenv("OLLAMA_HOST") or "http://localhost:11434", model_name)
 
 def pull_model(model_name):
     print(f"Pulling model '{model_name}'...")
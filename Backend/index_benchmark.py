@@ -0,0 +1,104 @@
+"""
+Recall-vs-latency report for the FAISS index types of build_faiss_index.
+
+Uses the vectors of the existing index and the example questions of the
+frontend as queries, and compares every index type against exact Flat search:
+
+    python -m Backend.index_benchmark --index_dir meta_data/faiss_index --k 5
+"""
+import argparse
+import os
+import time
+
+import faiss
+import numpy as np
+import yaml
+
+from Backend.helpers import INDEX_TYPES, build_faiss_index, embedding_model
+from Backend.index_store import INDEX_FILE, active_index_dir
+
+
+def stored_vectors(index_path):
+    """Read the vectors back from a saved index (exact for Flat and IVF-Flat indexes)"""
+    index = faiss.read_index(index_path)
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is None:
+        # Not an IVF index, reconstruct works without a direct map
+        return index.reconstruct_n(0, index.ntotal)
+    # Ids of a synced IVF index have gaps where vectors were removed
+    ids = np.concatenate([faiss.rev_swig_ptr(ivf.invlists.get_ids(list_no), ivf.invlists.list_size(list_no)).copy()
+                          for list_no in range(ivf.nlist) if ivf.invlists.list_size(list_no)])
+    ivf.set_direct_map_type(faiss.DirectMap.Hashtable)
+    return np.vstack([index.reconstruct(int(i)) for i in np.sort(ids)])
+
+
+def benchmark_index(index_type, vectors, queries, exact_ids, k):
+    start = time.perf_counter()
+    index = build_faiss_index(index_type, vectors.shape[1], n_vectors=len(vectors))
+    if not index.is_trained:
+        index.train(vectors)
+    index.add(vectors)
+    build_time = time.perf_counter() - start
+
+    latencies = []
+    found = []
+    for query in queries:
+        start = time.perf_counter()
+        _, ids = index.search(query.reshape(1, -1), k)
+        latencies.append((time.perf_counter() - start) * 1000)
+        found.append(ids[0])
+
+    recall = np.mean([len(set(f) & set(e)) / k for f, e in zip(found, exact_ids)])
+    return {
+        "index": index_type,
+        "recall": recall,
+        "mean_ms": float(np.mean(latencies)),
+        "p95_ms": float(np.percentile(latencies, 95)),
+        "memory_mb": len(faiss.serialize_index(index)) / 1e6,
+        "build_s": build_time,
+    }
+
+
+def recall_latency_report(vectors, queries, k=5, index_types=INDEX_TYPES):
+    exact = faiss.IndexFlatL2(vectors.shape[1])
+    exact.add(vectors)
+    _, exact_ids = exact.search(queries, k)
+
+    results = []
+    for index_type in index_types:
+        try:
+            results.append(benchmark_index(index_type, vectors, queries, exact_ids, k))
+        except RuntimeError as e:
+            print(f"⚠️ Skipping {index_type}: {e}")
+    return results
+
+
+def print_report(results, k):
+    print(f"\n{'index':<10} {'recall@' + str(k):>9} {'mean ms':>9} {'p95 ms':>9} {'memory MB':>10} {'build s':>9}")
+    for r in results:
+        print(f"{r['index']:<10} {r['recall']:>9.3f} {r['mean_ms']:>9.3f} {r['p95_ms']:>9.3f} "
+              f"{r['memory_mb']:>10.2f} {r['build_s']:>9.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare FAISS index types against exact search")
+    parser.add_argument("--index_dir", type=str, default="meta_data/faiss_index")
+    parser.add_argument("--frontend_text", type=str, default="Frontend/assets/frontend_text.yaml")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--random_queries", type=int, default=100,
+                        help="Corpus vectors (with noise) used as extra queries")
+    args = parser.parse_args()
+
+    vectors = np.ascontiguousarray(stored_vectors(os.path.join(active_index_dir(args.index_dir), INDEX_FILE)), dtype="float32")
+
+    with open(args.frontend_text, "r", encoding="utf-8") as file:
+        questions = [q for topic in yaml.safe_load(file)["topic_questions"].values() for q in topic]
+    queries = np.array(embedding_model().embed_documents(questions), dtype="float32")
+
+    rng = np.random.default_rng(0)
+    sample = vectors[rng.choice(len(vectors), size=min(args.random_queries, len(vectors)), replace=False)]
+    noisy = sample + rng.normal(scale=sample.std() * 0.1, size=sample.shape).astype("float32")
+    queries = np.vstack([queries, noisy]).astype("float32")
+
+    print(f"Corpus: {len(vectors)} vectors of {vectors.shape[1]} dims, {len(queries)} queries")
+    print_report(recall_latency_report(vectors, queries, k=args.k), args.k)
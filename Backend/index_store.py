@@ -0,0 +1,290 @@
+"""
+On-disk format of the vector store without pickle:
+
+    index.faiss           native FAISS index, opened with IO_FLAG_MMAP when serving
+    index.sqlite          docstore (chunk id -> Document) and the FAISS position -> id map
+    index_parents.sqlite  full sections (doc_id -> Document) the chunks were split from
+
+Worker processes on one host map the same index file and share its page
+cache, and opening the store does not read the documents into memory.
+
+Every build or sync writes a complete new version into versions/<name>/ and
+then points the CURRENT file at it with a single rename, so readers see
+either the old or the new set of files, never a mix:
+
+    meta_data/faiss_index/CURRENT
+    meta_data/faiss_index/versions/20250101T120000-1a2b3c4d/index.faiss ...
+"""
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+from collections.abc import Mapping
+
+import faiss
+from langchain_community.docstore.base import AddableMixin, Docstore
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+from langchain_core.stores import BaseStore
+
+
+INDEX_FILE = "index.faiss"
+DOCSTORE_FILE = "index.sqlite"
+PARENT_STORE_FILE = "index_parents.sqlite"
+LEGACY_DOCSTORE_FILE = "index.pkl"
+CURRENT_FILE = "CURRENT"
+VERSIONS_DIR = "versions"
+
+
+def active_index_dir(index_dir):
+    """Directory of the live index version, `index_dir` itself for stores written before versioning"""
+    try:
+        with open(os.path.join(index_dir, CURRENT_FILE), "r", encoding="utf-8") as f:
+            version = f.read().strip()
+    except FileNotFoundError:
+        return index_dir
+    return os.path.join(index_dir, VERSIONS_DIR, version)
+
+
+def new_index_version(index_dir):
+    """Create an empty directory for the next index version, it is invisible until published"""
+    version = f"{time.strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:8]}"
+    path = os.path.join(index_dir, VERSIONS_DIR, version)
+    os.makedirs(path)
+    return path
+
+
+def publish_index_version(index_dir, version_dir):
+    """
+    Make `version_dir` the live index by replacing CURRENT in one rename.
+    The previous version stays on disk, older versions and leftovers of
+    crashed builds are removed. A server that opened an older version keeps
+    working from its open files: the FAISS index is memory-mapped and the
+    read-only SQLite stores are opened when the server starts, not later.
+    """
+    previous = os.path.basename(active_index_dir(index_dir))
+    version = os.path.basename(version_dir)
+    tmp_path = os.path.join(index_dir, CURRENT_FILE + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(version)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, os.path.join(index_dir, CURRENT_FILE))
+
+    versions_dir = os.path.join(index_dir, VERSIONS_DIR)
+    for name in os.listdir(versions_dir):
+        if name not in (version, previous):
+            shutil.rmtree(os.path.join(versions_dir, name), ignore_errors=True)
+
+
+class SQLiteConnection:
+    """
+    Connection to one SQLite file.
+
+    Read-only stores open a single connection right away and share it
+    between threads, lookups are short primary key reads. The open file
+    keeps working after a newer index version was published and this
+    version's directory pruned, a connection opened later by path would fail.
+    Writable stores (ingestion) use one connection per thread.
+    """
+
+    def __init__(self, path, read_only=False):
+        self.path = path
+        self.read_only = read_only
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._shared = None
+        if read_only:
+            self._shared = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+            # Let SQLite read the file through mmap as well
+            self._shared.execute("PRAGMA mmap_size = 268435456")
+
+    def get(self):
+        """Connection for writes, per thread"""
+        if self.read_only:
+            raise sqlite3.OperationalError(f"{self.path} was opened read-only")
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, check_same_thread=False)
+            self._local.connection = connection
+        return connection
+
+    def query(self, sql, params=()):
+        """All rows of a read, works for read-only and writable stores"""
+        if not self.read_only:
+            return self.get().execute(sql, params).fetchall()
+        with self._lock:
+            return self._shared.execute(sql, params).fetchall()
+
+
+class SQLiteDocstore(Docstore, AddableMixin):
+    """Docstore for langchain's FAISS wrapper, one row per document"""
+
+    def __init__(self, path, read_only=False):
+        self.db = SQLiteConnection(path, read_only=read_only)
+        if not read_only:
+            connection = self.db.get()
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS documents (id TEXT PRIMARY KEY, page_content TEXT, metadata TEXT)"
+            )
+            connection.commit()
+
+    def add(self, texts):
+        connection = self.db.get()
+        rows = [(doc_id, doc.page_content, json.dumps(doc.metadata)) for doc_id, doc in texts.items()]
+        try:
+            connection.executemany("INSERT INTO documents (id, page_content, metadata) VALUES (?, ?, ?)", rows)
+        except sqlite3.IntegrityError as e:
+            connection.rollback()
+            raise ValueError(f"Tried to add ids that already exist: {e}")
+        connection.commit()
+
+    def delete(self, ids):
+        connection = self.db.get()
+        connection.executemany("DELETE FROM documents WHERE id = ?", [(doc_id,) for doc_id in ids])
+        connection.commit()
+
+    def search(self, search):
+        rows = self.db.query("SELECT page_content, metadata FROM documents WHERE id = ?", (search,))
+        if not rows:
+            return f"ID {search} not found."
+        return Document(page_content=rows[0][0], metadata=json.loads(rows[0][1]))
+
+    def __len__(self):
+        return self.db.query("SELECT COUNT(*) FROM documents")[0][0]
+
+
+class SQLiteIndexMap(Mapping):
+    """FAISS position -> docstore id, looked up on demand instead of loaded at startup"""
+
+    def __init__(self, path):
+        self.db = SQLiteConnection(path, read_only=True)
+
+    def __getitem__(self, position):
+        rows = self.db.query("SELECT doc_id FROM id_map WHERE position = ?", (int(position),))
+        if not rows:
+            raise KeyError(position)
+        return rows[0][0]
+
+    def __iter__(self):
+        for (position,) in self.db.query("SELECT position FROM id_map ORDER BY position"):
+            yield position
+
+    def __len__(self):
+        return self.db.query("SELECT COUNT(*) FROM id_map")[0][0]
+
+
+class SQLiteDocumentStore(BaseStore):
+    """
+    Key-value store of parent documents for MultiVectorRetriever.
+
+    Child chunk hits are resolved to their full section with one primary
+    key lookup each, nothing is loaded into memory up front.
+    """
+
+    def __init__(self, path, read_only=False):
+        self.db = SQLiteConnection(path, read_only=read_only)
+        if not read_only:
+            connection = self.db.get()
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS parents (id TEXT PRIMARY KEY, page_content TEXT, metadata TEXT)"
+            )
+            connection.commit()
+
+    def mget(self, keys):
+        documents = []
+        for key in keys:
+            rows = self.db.query("SELECT page_content, metadata FROM parents WHERE id = ?", (key,))
+            documents.append(Document(page_content=rows[0][0], metadata=json.loads(rows[0][1])) if rows else None)
+        return documents
+
+    def mset(self, key_value_pairs):
+        connection = self.db.get()
+        connection.executemany(
+            "INSERT OR REPLACE INTO parents (id, page_content, metadata) VALUES (?, ?, ?)",
+            [(key, doc.page_content, json.dumps(doc.metadata)) for key, doc in key_value_pairs],
+        )
+        connection.commit()
+
+    def mdelete(self, keys):
+        connection = self.db.get()
+        connection.executemany("DELETE FROM parents WHERE id = ?", [(key,) for key in keys])
+        connection.commit()
+
+    def yield_keys(self, prefix=None):
+        if prefix:
+            rows = self.db.query("SELECT id FROM parents WHERE id LIKE ? || '%'", (prefix,))
+        else:
+            rows = self.db.query("SELECT id FROM parents")
+        for (key,) in rows:
+            yield key
+
+
+def open_parent_store(folder_path):
+    """Read-only parent store of the index, None for indexes built without one"""
+    path = os.path.join(folder_path, PARENT_STORE_FILE)
+    if not os.path.exists(path):
+        return None
+    return SQLiteDocumentStore(path, read_only=True)
+
+
+def save_index_store(vectorstore, folder_path):
+    """Write `vectorstore` as index.faiss + index.sqlite into `folder_path`"""
+    os.makedirs(folder_path, exist_ok=True)
+    faiss.write_index(vectorstore.index, os.path.join(folder_path, INDEX_FILE))
+
+    db_path = os.path.join(folder_path, DOCSTORE_FILE)
+    if os.path.exists(db_path):
+        os.remove(db_path)
+    docstore = SQLiteDocstore(db_path)
+    connection = docstore.db.get()
+    connection.execute("CREATE TABLE id_map (position INTEGER PRIMARY KEY, doc_id TEXT)")
+    connection.executemany(
+        "INSERT INTO id_map (position, doc_id) VALUES (?, ?)",
+        [(int(position), doc_id) for position, doc_id in vectorstore.index_to_docstore_id.items()],
+    )
+    connection.commit()
+    docstore.add({doc_id: vectorstore.docstore.search(doc_id) for doc_id in vectorstore.index_to_docstore_id.values()})
+    connection.close()
+
+
+def index_store_exists(folder_path):
+    index_file = os.path.join(folder_path, INDEX_FILE)
+    return os.path.exists(index_file) and (
+        os.path.exists(os.path.join(folder_path, DOCSTORE_FILE))
+        or os.path.exists(os.path.join(folder_path, LEGACY_DOCSTORE_FILE))
+    )
+
+
+def load_index_store(folder_path, embeddings, read_only=True):
+    """
+    Open the vector store in `folder_path`.
+
+    read_only=True  memory-maps the index and reads documents from SQLite on demand (serving)
+    read_only=False loads everything into memory so it can be modified and saved again (ingestion)
+
+    Stores written before index.sqlite existed are loaded from index.pkl.
+    """
+    db_path = os.path.join(folder_path, DOCSTORE_FILE)
+    if not os.path.exists(db_path):
+        return FAISS.load_local(folder_path, embeddings, allow_dangerous_deserialization=True)
+
+    index_path = os.path.join(folder_path, INDEX_FILE)
+    if not read_only:
+        docstore = SQLiteDocstore(db_path, read_only=True)
+        index_to_docstore_id = dict(SQLiteIndexMap(db_path).items())
+        documents = {doc_id: docstore.search(doc_id) for doc_id in index_to_docstore_id.values()}
+        return FAISS(embedding_function=embeddings, index=faiss.read_index(index_path),
+                     docstore=InMemoryDocstore(documents), index_to_docstore_id=index_to_docstore_id)
+
+    try:
+        index = faiss.read_index(index_path, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+    except RuntimeError:
+        # This index type cannot be memory-mapped by the installed FAISS
+        index = faiss.read_index(index_path)
+    return FAISS(embedding_function=embeddings, index=index,
+                 docstore=SQLiteDocstore(db_path, read_only=True), index_to_docstore_id=SQLiteIndexMap(db_path))
@@ -0,0 +1,236 @@
+"""
+Load balancing of generations across several Ollama servers.
+
+    OLLAMA_HOSTS=http://gpu-1:11434,http://gpu-2:11434 python run_chatbot.py
+
+Every request goes to the healthy node with the fewest outstanding requests,
+each node runs at most `max_concurrency` generations at once. A node that
+fails before the first token is marked down and the request is retried on
+the next one, a background health check brings nodes back.
+
+Against local stub servers (anything answering /api/tags and /api/generate,
+e.g. `python -m Backend.ollama_stub --port 8001`):
+
+    python -m Backend.llm_router --hosts http://localhost:8001,http://localhost:8002 --requests 20
+"""
+import argparse
+import asyncio
+import logging
+import os
+import threading
+import time
+
+import aiohttp
+import requests
+
+from Backend.ollama_client import OllamaClient
+
+
+logger = logging.getLogger(__name__)
+
+
+def ollama_hosts_from_env(default=None):
+    """OLLAMA_HOSTS as a list, falls back to `default` (one host or None)"""
+    hosts = [host.strip() for host in os.getenv("OLLAMA_HOSTS", "").split(",") if host.strip()]
+    return hosts or [default]
+
+
+class OllamaEndpoint:
+    """One Ollama node: its client, in-flight request count and health"""
+
+    def __init__(self, client, max_concurrency=4):
+        self.client = client
+        self.max_concurrency = max_concurrency
+        self.outstanding = 0
+        self.healthy = True
+        self.served = 0
+        self.failures = 0
+
+    @property
+    def has_capacity(self):
+        return self.healthy and self.outstanding < self.max_concurrency
+
+    def check_health(self, timeout=2):
+        try:
+            self.healthy = self.client.session.get(f"{self.client.base_url}/api/tags", timeout=timeout).ok
+        except requests.RequestException:
+            self.healthy = False
+        return self.healthy
+
+
+class LLMRouter:
+    """
+    Same stream/astream/warmup interface as OllamaClient, spread over several nodes.
+    Least outstanding requests first, per-node concurrency limits, failover before the first token.
+    """
+
+    def __init__(self, clients, max_concurrency=4, health_interval=10, wait_timeout=120):
+        self.endpoints = [OllamaEndpoint(client, max_concurrency) for client in clients]
+        self.wait_timeout = wait_timeout
+        self._condition = threading.Condition()
+        self._health_stop = threading.Event()
+        if health_interval:
+            threading.Thread(target=self._health_loop, args=(health_interval,), daemon=True,
+                             name="llm-router-health").start()
+
+    def _health_loop(self, interval):
+        while not self._health_stop.wait(interval):
+            for endpoint in self.endpoints:
+                was_healthy = endpoint.healthy
+                if endpoint.check_health() != was_healthy:
+                    logger.warning(f"Ollama node {endpoint.client.base_url} is "
+                                   f"{'back up' if endpoint.healthy else 'down'}")
+            with self._condition:
+                self._condition.notify_all()
+
+    def _try_acquire(self, exclude):
+        with self._condition:
+            candidates = [e for e in self.endpoints if e.has_capacity and e not in exclude]
+            if not candidates:
+                return None
+            endpoint = min(candidates, key=lambda e: e.outstanding)
+            endpoint.outstanding += 1
+            return endpoint
+
+    def _acquire(self, exclude):
+        deadline = time.monotonic() + self.wait_timeout
+        with self._condition:
+            while True:
+                endpoint = self._try_acquire(exclude)
+                if endpoint is not None:
+                    return endpoint
+                if not self._available(exclude):
+                    return None
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError("No Ollama node became free in time")
+                self._condition.wait(remaining)
+
+    async def _aacquire(self, exclude):
+        deadline = time.monotonic() + self.wait_timeout
+        while True:
+            endpoint = self._try_acquire(exclude)
+            if endpoint is not None:
+                return endpoint
+            if not self._available(exclude):
+                return None
+            if time.monotonic() > deadline:
+                raise TimeoutError("No Ollama node became free in time")
+            await asyncio.sleep(0.05)
+
+    def _available(self, exclude):
+        """Whether a healthy node not tried yet exists, busy or not"""
+        return any(e.healthy and e not in exclude for e in self.endpoints)
+
+    def _release(self, endpoint, failed=False):
+        with self._condition:
+            endpoint.outstanding -= 1
+            if failed:
+                endpoint.failures += 1
+                endpoint.healthy = False
+            else:
+                endpoint.served += 1
+            self._condition.notify_all()
+
+    def stream(self, prompt, stop=None):
+        tried = []
+        while True:
+            endpoint = self._acquire(tried)
+            if endpoint is None:
+                raise ConnectionError(f"All Ollama nodes failed or are down: {[e.client.base_url for e in tried]}")
+            tried.append(endpoint)
+            started = False
+            try:
+                for chunk in endpoint.client.stream(prompt, stop):
+                    started = True
+                    yield chunk
+            except (requests.RequestException, RuntimeError) as e:
+                self._release(endpoint, failed=True)
+                # Once tokens were sent the answer cannot be restarted on another node
+                if started:
+                    raise
+                logger.warning(f"Ollama node {endpoint.client.base_url} failed, trying the next one: {e}")
+                continue
+            except BaseException:
+                # Client went away mid-stream (GeneratorExit), the node itself is fine
+                self._release(endpoint)
+                raise
+            self._release(endpoint)
+            return
+
+    async def astream(self, prompt, stop=None):
+        tried = []
+        while True:
+            endpoint = await self._aacquire(tried)
+            if endpoint is None:
+                raise ConnectionError(f"All Ollama nodes failed or are down: {[e.client.base_url for e in tried]}")
+            tried.append(endpoint)
+            started = False
+            try:
+                async for chunk in endpoint.client.astream(prompt, stop):
+                    started = True
+                    yield chunk
+            except (aiohttp.ClientError, asyncio.TimeoutError, RuntimeError) as e:
+                self._release(endpoint, failed=True)
+                if started:
+                    raise
+                logger.warning(f"Ollama node {endpoint.client.base_url} failed, trying the next one: {e}")
+                continue
+            except BaseException:
+                self._release(endpoint)
+                raise
+            self._release(endpoint)
+            return
+
+    def warmup(self, timeout=None):
+        """Load the model on every node, nodes that cannot be reached are marked down"""
+        for endpoint in self.endpoints:
+            try:
+                endpoint.client.warmup(timeout=timeout)
+            except requests.RequestException as e:
+                endpoint.healthy = False
+                logger.warning(f"Ollama node {endpoint.client.base_url} is not reachable: {e}")
+        if not any(endpoint.healthy for endpoint in self.endpoints):
+            raise requests.ConnectionError("No Ollama node is reachable")
+        return True
+
+    def stats(self):
+        return [{"host": e.client.base_url, "healthy": e.healthy, "outstanding": e.outstanding,
+                 "served": e.served, "failures": e.failures} for e in self.endpoints]
+
+    def close(self):
+        self._health_stop.set()
+        for endpoint in self.endpoints:
+            endpoint.client.close()
+
+
+def build_llm_client(model_name, hosts, keep_alive="30m", temperature=0.1, heartbeat_interval=None,
+                     max_concurrency=4, num_ctx=None):
+    """A single OllamaClient for one host, an LLMRouter over all of them for several"""
+    clients = [OllamaClient(model_name, base_url=host, keep_alive=keep_alive, temperature=temperature,
+                            heartbeat_interval=heartbeat_interval, num_ctx=num_ctx) for host in hosts]
+    if len(clients) == 1:
+        return clients[0]
+    return LLMRouter(clients, max_concurrency=max_concurrency)
+
+
+if __name__ == "__main__":
+    from concurrent.futures import ThreadPoolExecutor
+
+    parser = argparse.ArgumentParser(description="Send concurrent prompts through the LLM router")
+    parser.add_argument("--hosts", type=str, required=True, help="Comma separated Ollama (or stub) URLs")
+    parser.add_argument("--model", type=str, default="mistral")
+    parser.add_argument("--requests", type=int, default=20)
+    parser.add_argument("--max_concurrency", type=int, default=4)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    router = LLMRouter([OllamaClient(args.model, base_url=host) for host in args.hosts.split(",")],
+                       max_concurrency=args.max_concurrency)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.requests) as pool:
+        answers = list(pool.map(lambda i: "".join(router.stream(f"Say hello #{i}")), range(args.requests)))
+    print(f"✅ {len(answers)} answers in {time.perf_counter() - start:.2f}s")
+    for node in router.stats():
+        print(node)
+    router.close()
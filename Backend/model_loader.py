@@ -0,0 +1,120 @@
+"""
+Builds the chat model in a background thread, so the web server binds its
+port right away instead of after the index sync, the embedder and the
+Ollama warm-up. Nothing heavy is imported by this module.
+"""
+import asyncio
+import logging
+import threading
+import time
+
+
+logger = logging.getLogger(__name__)
+
+
+class LoadingStatus:
+    """Yielded instead of a token while the model is still loading"""
+
+    def __init__(self, message):
+        self.message = message
+
+
+class BackgroundModel:
+    """
+    Stand-in for Ollama_RAG / dummy_model while `factory` builds it in a thread.
+
+    `factory(set_stage)` returns the model and may report what it is doing
+    through `set_stage`. Questions asked before the model is ready wait up to
+    `wait_seconds` and see the loading stage meanwhile. Language choices are
+    remembered and applied to the model once it exists. `on_failure(error)`
+    is called when the factory raises, e.g. to exit so a supervisor restarts.
+    """
+
+    def __init__(self, factory, wait_seconds=120, on_failure=None):
+        self.factory = factory
+        self.wait_seconds = wait_seconds
+        self.on_failure = on_failure
+        self.model = None
+        self.state = "starting"
+        self.stage = "starting"
+        self.error = None
+        self.started_at = time.perf_counter()
+        self.load_time = None
+        self._language_prompts = {}
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        threading.Thread(target=self._load, daemon=True, name="model-loader").start()
+
+    def set_stage(self, stage):
+        self.stage = stage
+        logger.info(f"Model loading: {stage}")
+        print(f"⏳ {stage}...")
+
+    def _load(self):
+        try:
+            model = self.factory(self.set_stage)
+        except Exception as e:
+            self.error = e
+            self.state = "failed"
+            logger.exception("Model loading failed")
+            print(f"✗ Failed to load the model: {e}")
+            if self.on_failure is not None:
+                self.on_failure(e)
+            return
+        with self._lock:
+            for session_id, language in self._language_prompts.items():
+                model.set_language_prompt(language, session_id=session_id)
+            self.model = model
+            self.state = "ready"
+        self.load_time = time.perf_counter() - self.started_at
+        print(f"✅ Model ready after {self.load_time:.1f}s")
+        self._ready.set()
+
+    @property
+    def ready(self):
+        return self.state == "ready"
+
+    @property
+    def status(self):
+        """Readiness as shown in the UI"""
+        if self.state == "ready":
+            return "✅ The assistant is ready."
+        if self.state == "failed":
+            return f"✗ The assistant could not be started: {self.error}"
+        elapsed = time.perf_counter() - self.started_at
+        return f"⏳ The assistant is starting up ({self.stage}, {elapsed:.0f}s). You can already choose a language."
+
+    def wait(self, timeout=None):
+        return self._ready.wait(timeout)
+
+    def set_language_prompt(self, language, session_id="default"):
+        with self._lock:
+            if self.model is None:
+                self._language_prompts[session_id] = language
+                return
+        self.model.set_language_prompt(language, session_id=session_id)
+
+    def _not_ready_message(self):
+        if self.state == "failed":
+            return self.status
+        return "⏳ The assistant is still starting up. Please ask your question again in a moment."
+
+    async def astream_question(self, message, session_id="default"):
+        deadline = time.perf_counter() + self.wait_seconds
+        while self.state == "starting" and time.perf_counter() < deadline:
+            yield LoadingStatus(self.status)
+            await asyncio.sleep(1)
+        if not self.ready:
+            yield self._not_ready_message()
+            return
+        async for chunk in self.model.astream_question(message, session_id=session_id):
+            yield chunk
+
+    def stream_question(self, message, session_id="default"):
+        if not self.wait(self.wait_seconds):
+            yield self._not_ready_message()
+            return
+        yield from self.model.stream_question(message, session_id=session_id)
+
+    def single_question(self, message, session_id="default"):
+        return "".join(self.stream_question(message, session_id=session_id))
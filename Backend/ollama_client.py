@@ -0,0 +1,162 @@
+"""
+Managed Ollama client.
+
+langchain's Ollama LLM opens new HTTP connections for every request and
+lets Ollama unload the model after its default 5 minutes of idle time, so
+the next question pays the model load. OllamaClient keeps one pooled
+requests session (and one aiohttp session per event loop), sends
+`keep_alive` with every request, loads the model at startup and pings it
+periodically so it stays resident.
+"""
+import asyncio
+import json
+import logging
+import threading
+from typing import Any, List, Optional
+
+import aiohttp
+import requests
+from requests.adapters import HTTPAdapter
+from langchain_core.language_models.llms import LLM
+from langchain_core.outputs import GenerationChunk
+
+
+DEFAULT_OLLAMA_URL = "http://localhost:11434"
+
+logger = logging.getLogger(__name__)
+
+
+class OllamaClient:
+    """Streaming /api/generate client for one Ollama server"""
+
+    def __init__(self, model, base_url=None, keep_alive="30m", temperature=0.1, pool_size=32,
+                 timeout=300, heartbeat_interval=None, num_ctx=None):
+        self.model = model
+        self.base_url = (base_url or DEFAULT_OLLAMA_URL).rstrip("/")
+        self.keep_alive = keep_alive
+        self.options = {"temperature": temperature}
+        # Context window in tokens, Ollama's default is smaller than the prompt budget
+        self.load_options = {"num_ctx": num_ctx} if num_ctx else {}
+        self.options.update(self.load_options)
+        self.timeout = timeout
+        self.pool_size = pool_size
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._async_sessions = {}
+
+        self._heartbeat_stop = threading.Event()
+        self._heartbeat_thread = None
+        if heartbeat_interval:
+            self.start_heartbeat(heartbeat_interval)
+
+    def _payload(self, prompt, stop=None):
+        options = dict(self.options)
+        if stop:
+            options["stop"] = stop
+        return {"model": self.model, "prompt": prompt, "stream": True,
+                "keep_alive": self.keep_alive, "options": options}
+
+    def stream(self, prompt, stop=None):
+        """Yield the answer text piece by piece"""
+        with self.session.post(f"{self.base_url}/api/generate", json=self._payload(prompt, stop),
+                               stream=True, timeout=self.timeout) as response:
+            response.raise_for_status()
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                data = json.loads(line)
+                if "error" in data:
+                    raise RuntimeError(f"Ollama error: {data['error']}")
+                if data.get("response"):
+                    yield data["response"]
+                if data.get("done"):
+                    break
+
+    def _async_session(self):
+        # aiohttp sessions are bound to the loop they were created on
+        loop = asyncio.get_running_loop()
+        session = self._async_sessions.get(loop)
+        if session is None or session.closed:
+            session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.pool_size),
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+            )
+            self._async_sessions[loop] = session
+        return session
+
+    async def astream(self, prompt, stop=None):
+        session = self._async_session()
+        async with session.post(f"{self.base_url}/api/generate", json=self._payload(prompt, stop)) as response:
+            response.raise_for_status()
+            async for line in response.content:
+                if not line.strip():
+                    continue
+                data = json.loads(line)
+                if "error" in data:
+                    raise RuntimeError(f"Ollama error: {data['error']}")
+                if data.get("response"):
+                    yield data["response"]
+                if data.get("done"):
+                    break
+
+    def warmup(self, timeout=None):
+        """Load the model into memory: a generate without prompt only loads it"""
+        response = self.session.post(f"{self.base_url}/api/generate",
+                                     json={"model": self.model, "keep_alive": self.keep_alive,
+                                           # Loaded with the same num_ctx, otherwise the first question reloads it
+                                           "options": self.load_options},
+                                     timeout=timeout or self.timeout)
+        response.raise_for_status()
+        return True
+
+    def start_heartbeat(self, interval):
+        """Warm the model up again every `interval` seconds, keep it well below keep_alive"""
+        if self._heartbeat_thread is not None:
+            return
+
+        def beat():
+            while not self._heartbeat_stop.wait(interval):
+                try:
+                    self.warmup(timeout=30)
+                except requests.RequestException as e:
+                    logger.warning(f"Ollama heartbeat to {self.base_url} failed: {e}")
+
+        self._heartbeat_thread = threading.Thread(target=beat, daemon=True, name="ollama-heartbeat")
+        self._heartbeat_thread.start()
+
+    def close(self):
+        self._heartbeat_stop.set()
+        self.session.close()
+
+
+class PooledOllama(LLM):
+    """LangChain LLM on top of an OllamaClient (or anything with the same stream/astream methods)"""
+
+    client: Any
+
+    @property
+    def _llm_type(self):
+        return "pooled-ollama"
+
+    def _call(self, prompt: str, stop: Optional[List[str]] = None, run_manager=None, **kwargs) -> str:
+        return "".join(self.client.stream(prompt, stop))
+
+    async def _acall(self, prompt: str, stop: Optional[List[str]] = None, run_manager=None, **kwargs) -> str:
+        return "".join([chunk async for chunk in self.client.astream(prompt, stop)])
+
+    def _stream(self, prompt, stop=None, run_manager=None, **kwargs):
+        for text in self.client.stream(prompt, stop):
+            chunk = GenerationChunk(text=text)
+            if run_manager:
+                run_manager.on_llm_new_token(text, chunk=chunk)
+            yield chunk
+
+    async def _astream(self, prompt, stop=None, run_manager=None, **kwargs):
+        async for text in self.client.astream(prompt, stop):
+            chunk = GenerationChunk(text=text)
+            if run_manager:
+                await run_manager.on_llm_new_token(text, chunk=chunk)
+            yield chunk
@@ -0,0 +1,135 @@
+"""
+In-process stand-in for an Ollama server, for tests and router benchmarks.
+
+Answers /api/tags with one model and streams /api/generate as NDJSON, one
+token per line, like Ollama does. A node can be taken down (HTTP 503 on
+every request) or made to fail after a number of tokens, and it records how
+many generations ran at once.
+
+    python -m Backend.ollama_stub --port 8001 --token_delay 0.05
+"""
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StubOllama:
+    """One stub node on 127.0.0.1, `port=0` picks a free port"""
+
+    def __init__(self, model="mistral", tokens=("Hello", ",", " world"), token_delay=0.0, port=0):
+        self.model = model
+        self.tokens = list(tokens)
+        self.token_delay = token_delay
+        # Answer every request with 503
+        self.down = False
+        # Send an error record after this many tokens
+        self.fail_after = None
+        self.requests = 0
+        self.active = 0
+        self.peak = 0
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), self._handler())
+        self.server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def log_message(self, format, *args):
+                pass
+
+            def _json(self, status, body):
+                data = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                if stub.down:
+                    self._json(503, {"error": "node is down"})
+                elif self.path == "/api/tags":
+                    self._json(200, {"models": [{"name": f"{stub.model}:latest"}]})
+                else:
+                    self._json(404, {"error": "not found"})
+
+            def do_POST(self):
+                payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                if stub.down:
+                    self._json(503, {"error": "node is down"})
+                elif self.path != "/api/generate":
+                    self._json(404, {"error": "not found"})
+                elif not payload.get("prompt"):
+                    # A generate without prompt only loads the model
+                    self._json(200, {"model": stub.model, "done": True})
+                else:
+                    stub._generate(self)
+
+        return Handler
+
+    def _generate(self, handler):
+        with self._lock:
+            self.requests += 1
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        try:
+            # No Content-Length, the stream ends when the connection closes
+            handler.send_response(200)
+            handler.send_header("Content-Type", "application/x-ndjson")
+            handler.end_headers()
+            for i, token in enumerate(self.tokens):
+                if self.fail_after is not None and i >= self.fail_after:
+                    self._write(handler, {"error": "stub failure"})
+                    return
+                time.sleep(self.token_delay)
+                self._write(handler, {"model": self.model, "response": token, "done": False})
+            self._write(handler, {"model": self.model, "response": "", "done": True})
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            with self._lock:
+                self.active -= 1
+
+    @staticmethod
+    def _write(handler, record):
+        handler.wfile.write((json.dumps(record) + "\n").encode("utf-8"))
+        handler.wfile.flush()
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True, name="ollama-stub")
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve a stub Ollama node")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--model", type=str, default="mistral")
+    parser.add_argument("--token_delay", type=float, default=0.05, help="Seconds between streamed tokens")
+    args = parser.parse_args()
+
+    stub = StubOllama(args.model, token_delay=args.token_delay, port=args.port)
+    print(f"✅ Stub Ollama on {stub.url}")
+    try:
+        stub.server.serve_forever()
+    except KeyboardInterrupt:
+        stub.server.server_close()
@@ -0,0 +1,147 @@
+"""
+Token-budgeted assembly of the RAG prompt.
+
+Every section of the prompt (instructions, history, context, question) gets
+its own token budget, so prefill time stays flat however long a session
+runs. The oldest turns are dropped first (or folded into the rolling
+summary), and the lowest-ranked chunks are cut before better ones.
+"""
+import logging
+from functools import lru_cache
+
+
+# Hugging Face tokenizer of each Ollama model, counts match what Ollama prefills
+MODEL_TOKENIZERS = {
+    "mistral": "mistralai/Mistral-7B-Instruct-v0.3",
+    "gpt-oss": "openai/gpt-oss-20b",
+}
+
+DEFAULT_BUDGET = {
+    "instructions": 512,
+    "history": 1024,
+    "context": 1536,
+    "question": 256,
+}
+
+logger = logging.getLogger(__name__)
+
+
+class TokenCounter:
+    """
+    Counts tokens with the target model's tokenizer.
+    Falls back to ~4 characters per token when the tokenizer cannot be loaded (offline, gated repo).
+    """
+
+    def __init__(self, model_name):
+        self.tokenizer = None
+        tokenizer_name = MODEL_TOKENIZERS.get(model_name.split(":")[0])
+        if tokenizer_name:
+            try:
+                from transformers import AutoTokenizer
+                self.tokenizer = AutoTokenizer.from_pretrained(tokenizer_name)
+            except Exception as e:
+                logger.warning(f"Tokenizer {tokenizer_name} not available, estimating token counts: {e}")
+        self.count = lru_cache(maxsize=4096)(self._count)
+
+    def _count(self, text):
+        if self.tokenizer is None:
+            return (len(text) + 3) // 4
+        return len(self.tokenizer.encode(text, add_special_tokens=False))
+
+    def truncate(self, text, max_tokens):
+        """Keep the beginning of `text` up to `max_tokens` tokens"""
+        if max_tokens <= 0:
+            return ""
+        if self.count(text) <= max_tokens:
+            return text
+        if self.tokenizer is None:
+            return text[:max_tokens * 4]
+        ids = self.tokenizer.encode(text, add_special_tokens=False)[:max_tokens]
+        return self.tokenizer.decode(ids)
+
+
+def conversation_turns(messages):
+    """(human, AI) message pairs of a history, system messages are skipped"""
+    turns = []
+    human = None
+    for message in messages:
+        if message.type == "human":
+            human = message.content
+        elif message.type == "ai" and human is not None:
+            turns.append((human, message.content))
+            human = None
+    return turns
+
+
+def format_turn(human, ai):
+    return f"Human: {human}\nAI: {ai}\n\n"
+
+
+class PromptBuilder:
+    """Fills the prompt variables of Ollama_RAG within per-section token budgets"""
+
+    def __init__(self, counter, budget=None, min_chunk_tokens=64):
+        self.counter = counter
+        self.budget = {**DEFAULT_BUDGET, **(budget or {})}
+        self.min_chunk_tokens = min_chunk_tokens
+
+    def build_history(self, messages, max_tokens, summary=None):
+        """
+        Most recent turns that fit into `max_tokens`, oldest turns are dropped first.
+        With a rolling summary, the turns it covers are replaced by the summary text.
+        """
+        turns = [format_turn(human, ai) for human, ai in conversation_turns(messages)]
+        prefix = ""
+        used = 0
+        if summary and summary.get("content"):
+            turns = turns[summary["summarized_turns"]:]
+            # The summary may take at most half of the history budget
+            prefix = f"Summary of the earlier conversation: {self.counter.truncate(summary['content'], max_tokens // 2)}\n\n"
+            used = self.counter.count(prefix)
+
+        kept = []
+        for turn in reversed(turns):
+            tokens = self.counter.count(turn)
+            if used + tokens > max_tokens:
+                break
+            kept.append(turn)
+            used += tokens
+        return prefix + "".join(reversed(kept)), used
+
+    def build_context(self, docs, max_tokens):
+        """Chunks in retrieval order until `max_tokens`, the first chunk that does not fit is truncated"""
+        parts = []
+        used = 0
+        for doc in docs:
+            remaining = max_tokens - used
+            tokens = self.counter.count(doc.page_content)
+            if tokens <= remaining:
+                parts.append(doc.page_content)
+                used += tokens
+                continue
+            # Lower-ranked chunks come later, they are the ones that get cut. The best chunk is always kept
+            if remaining >= self.min_chunk_tokens or not parts:
+                parts.append(self.counter.truncate(doc.page_content, remaining))
+            break
+        return "\n\n".join(parts)
+
+    def build(self, instructions, messages, docs, question, summary=None):
+        """Returns the prompt variables (language_level_prompt, chat_history, context, question)"""
+        history, history_tokens = self.build_history(messages, self.budget["history"], summary)
+        # History budget a short session does not need goes to the context
+        context_budget = self.budget["context"] + self.budget["history"] - history_tokens
+        return {
+            "language_level_prompt": self.counter.truncate(instructions, self.budget["instructions"]),
+            "chat_history": history,
+            "context": self.build_context(docs, context_budget),
+            "question": self.counter.truncate(question, self.budget["question"]),
+        }
+
+    def context_window(self, template, answer_tokens=1024, multiple=1024):
+        """
+        Ollama num_ctx that holds every section budget, the template around them
+        and the answer, rounded up. With a smaller window Ollama silently cuts
+        the front of the prompt, the instructions go first.
+        """
+        needed = sum(self.budget.values()) + self.counter.count(template) + answer_tokens
+        return -(-needed // multiple) * multiple
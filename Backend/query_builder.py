@@ -0,0 +1,92 @@
+"""
+Retrieval query construction.
+
+Each strategy turns (history messages, user input) into one retrieval query:
+
+    history        last 4 messages (answers included) + the new input, the original behaviour
+    user_turns     the patient's recent questions + the new input
+    last_question  only the new input
+    keywords       the new input + salient terms of earlier questions, no LLM call
+
+Several strategies together give multi-query retrieval, see Ollama_RAG.retrieve.
+"""
+from collections import Counter
+
+from Backend.sparse_index import reciprocal_rank_fusion, tokenize
+
+
+STOPWORDS = frozenset("""
+a about after again all also am an and any are as at be because been before being but by can could did do
+does doing during each for from had has have having he her here how i if in into is it its just me more most
+my no nor not now of off on once only or other our out over own same she should so some such than that the
+their them then there these they this those through to too under until up very was we were what when where
+which while who whom why will with would you your yes okay ok please thanks thank tell know want need get
+""".split())
+
+
+def history_query(messages, user_input, history_turns=4):
+    recent_history = messages[-history_turns:]
+    history_text = " ".join([msg.content for msg in recent_history if msg.type != "system"])
+    # Merge last N turns with current user input
+    return f"{history_text}\nUser now says: {user_input}"
+
+
+def user_turns_query(messages, user_input, user_turns=2):
+    questions = [msg.content for msg in messages if msg.type == "human"][-user_turns:]
+    return "\n".join(questions + [user_input])
+
+
+def last_question_query(messages, user_input):
+    return user_input
+
+
+def keywords(text):
+    return [token for token in tokenize(text) if token not in STOPWORDS and len(token) > 2]
+
+
+def keyword_query(messages, user_input, user_turns=3, max_keywords=8):
+    """The new input plus the most frequent terms of earlier questions it does not mention itself"""
+    questions = [msg.content for msg in messages if msg.type == "human"][-user_turns:]
+    counts = Counter(term for question in questions for term in keywords(question))
+    present = set(tokenize(user_input))
+    extra = [term for term, _ in counts.most_common() if term not in present][:max_keywords]
+    return " ".join([user_input] + extra)
+
+
+QUERY_BUILDERS = {
+    "history": history_query,
+    "user_turns": user_turns_query,
+    "last_question": last_question_query,
+    "keywords": keyword_query,
+}
+
+
+def build_queries(strategies, messages, user_input):
+    """One query per strategy, duplicates removed, the first strategy's query comes first"""
+    if isinstance(strategies, str):
+        strategies = [strategies]
+    queries = []
+    for strategy in strategies:
+        if strategy not in QUERY_BUILDERS:
+            raise ValueError(f"Unknown query strategy '{strategy}', use one of {list(QUERY_BUILDERS)}")
+        query = QUERY_BUILDERS[strategy](messages, user_input)
+        if query not in queries:
+            queries.append(query)
+    return queries
+
+
+def fuse_results(result_lists):
+    """Merge the documents retrieved for several queries by reciprocal-rank fusion"""
+    if len(result_lists) == 1:
+        return result_lists[0]
+    documents = {}
+    rankings = []
+    for docs in result_lists:
+        ranking = []
+        for doc in docs:
+            documents.setdefault(doc.page_content, doc)
+            ranking.append(doc.page_content)
+        rankings.append(ranking)
+    # As many documents as the longest single result, the prompt builder trims further
+    limit = max(len(docs) for docs in result_lists)
+    return [documents[key] for key in reciprocal_rank_fusion(rankings)[:limit]]
@@ -5,7 +5,6 @@ from pathlib import Path
 import time
 import sys
 import socket
-from langchain_community.llms import Ollama
 from langchain.prompts import ChatPromptTemplate
 from langchain.schema.runnable import RunnablePassthrough
 from langchain.schema import StrOutputParser
@@ -16,13 +15,46 @@ from langchain.embeddings import HuggingFaceEmbeddings
 # Import from your existing scripts
 #from utils import embedding_model
 from langchain_community.vectorstores import FAISS
+from langchain.retrievers.multi_vector import MultiVectorRetriever, SearchType
 from langchain_core.messages import HumanMessage, AIMessage
 # to sroye messages
 from langchain_core.chat_history import BaseChatMessageHistory
 from langchain_core.messages import BaseMessage, messages_from_dict, messages_to_dict
 from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
+import asyncio
+import functools
 import json
+import requests
 import os
+import re
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from Backend.answer_cache import ExampleAnswerCache, SemanticAnswerCache, answer_cache_fingerprint
+from Backend.embeddings import CachedEmbeddings, PooledEmbeddings
+from Backend.helpers import conversation_summary_chain
+from Backend.index_store import active_index_dir, load_index_store, open_parent_store
+from Backend.llm_router import build_llm_client, ollama_hosts_from_env
+from Backend.ollama_client import PooledOllama
+from Backend.prompt_builder import PromptBuilder, TokenCounter, conversation_turns, format_turn
+from Backend.query_builder import build_queries, fuse_results
+from Backend.readiness import ollama_reachable
+from Backend.reranker import CrossEncoderReranker
+from Backend.scheduler import GenerationScheduler, QueueStatus, SchedulerError
+from Backend.sparse_index import HybridRetriever, load_sparse_index
+from Backend.session_manager import ChatSession, SessionManager
+
+
+DEFAULT_SESSION_ID = "default"
+# Scheduler priority of background summaries, after follow-ups (0) and new conversations (1)
+SUMMARY_PRIORITY = 2
+
+
+def session_history_path(history_dir, session_id, storage="json"):
+    """One history file per session, e.g. ./meta_data/output/chat_history_<id>.json"""
+    safe_id = re.sub(r"[^A-Za-z0-9_-]", "_", str(session_id))
+    return os.path.join(history_dir, f"chat_history_{safe_id}.{storage}")
 
 
 def detect_ollama_setup():
@@ -45,57 +77,100 @@ def detect_ollama_setup():
         # Hostname looks like a Docker container ID
         return 'http://ollama:11434'
     
-    # Method 4: Try to connect to Docker Ollama first, fallback to local
-    try:
-        import requests
-        response = requests.get('http://ollama:11434/api/tags', timeout=2)
-        if response.status_code == 200:
-            return 'http://ollama:11434'
-    except:
-        pass
+    # Method 4: Try to connect to Docker Ollama first (short timeout), fallback to local
+    if ollama_reachable('http://ollama:11434', timeout=0.5):
+        return 'http://ollama:11434'
     
     # Default: Local setup (venv)
     return None
 
 
-def embedding_model(model_name="BAAI/bge-large-en-v1.5"):
+EMBEDDING_MODEL_NAME = "BAAI/bge-large-en-v1.5"
+
+
+def embedding_model(model_name=EMBEDDING_MODEL_NAME):
     return HuggingFaceEmbeddings(model_name=model_name)
 
 
 
 class dummy_model:
-    def __init__(self, history_file="./meta_data/output/chat_history.json"):
-        self.language_level_prompt = "default"
-        self.chat_history = FileChatMessageHistory(file_path=history_file)
+    def __init__(self, history_dir="./meta_data/output", max_sessions=256, session_ttl=3600):
+        self.history_dir = history_dir
+        self.sessions = SessionManager(self._create_session, max_sessions=max_sessions, ttl_seconds=session_ttl)
 
-    def single_question(self, message):
-        answer = f"You asked: {message}\n set language = {self.language_level_prompt}\n My answer: Honestly, I do not know the answer. I am just a dummy model."
+    def _create_session(self, session_id):
+        history_file = session_history_path(self.history_dir, session_id)
+        if os.path.exists(history_file):
+            os.remove(history_file)
+        return ChatSession(session_id, FileChatMessageHistory(file_path=history_file), language_level="default")
+
+    def stream_question(self, message, session_id=DEFAULT_SESSION_ID):
+        session = self.sessions.get(session_id)
+        answer = f"You asked: {message}\n set language = {session.language_level}\n My answer: Honestly, I do not know the answer. I am just a dummy model."
+
+        for word in re.findall(r"\S+\s*", answer):
+            yield word
+
+        session.chat_history.add_message(HumanMessage(content=message))
+        session.chat_history.add_message(AIMessage(content=answer))
 
-        self.chat_history.add_message(HumanMessage(content=message))
-        self.chat_history.add_message(AIMessage(content=answer))
-        return answer
+    async def astream_question(self, message, session_id=DEFAULT_SESSION_ID):
+        for chunk in self.stream_question(message, session_id=session_id):
+            yield chunk
 
-    def set_language_prompt(self, language):
-        self.chat_history.messages = [ m for m in self.chat_history.messages if m.type != "system"]
-        self.chat_history.add_message(SystemMessage(content=f"{language}"))
-        self.language_level_prompt = language
+    def single_question(self, message, session_id=DEFAULT_SESSION_ID):
+        return "".join(self.stream_question(message, session_id=session_id))
+
+    def set_language_prompt(self, language, session_id=DEFAULT_SESSION_ID):
+        session = self.sessions.get(session_id)
+        session.chat_history.set_system_message(SystemMessage(content=f"{language}"))
+        session.language_level = language
 
 
 
 class Ollama_RAG:
     """Class for RAG with Ollama and FAISS"""
     
-    def __init__(self,language_level,prompt_dict,rag_dir,model_name,logger, history_file="./meta_data/output/chat_history.json"):
-        # Chat history will be stored as a global variable
-        if os.path.exists(history_file):
-            os.remove(history_file)
-        self.chat_history = FileChatMessageHistory(file_path=history_file)
-        #self.chat_history = ChatMessageHistory()
+    def __init__(self,language_level,prompt_dict,rag_dir,model_name,logger, history_dir="./meta_data/output",
+                 max_sessions=256, session_ttl=3600, max_history_messages=200,
+                 history_storage="jsonl", history_flush_every=2, history_flush_interval_ms=500,
+                 history_compact_every=400, history_archive_dir="./meta_data/output/archive",
+                 history_retention_days=30, session_workers=4, archive_prune_interval=3600,
+                 embedding_workers=2, query_cache_size=1024, query_cache_ttl=None, query_cache_path=None,
+                 answer_cache_path="./meta_data/output/example_answers.json",
+                 semantic_cache_threshold=None, semantic_cache_path=None,
+                 rerank_top_n=None, rerank_fetch_k=20, hybrid_search=True, prompt_budget=None, answer_tokens=1024,
+                 summary_keep_turns=6, summary_batch_turns=4, query_strategy="user_turns",
+                 ollama_keep_alive="30m", ollama_heartbeat_interval=600, ollama_hosts=None,
+                 ollama_max_concurrency=4, max_concurrent_generations=None, max_queued_generations=32,
+                 queue_timeout=60, generation_timeout=180):
+        # Every Gradio session gets its own history and language level. The
+        # LLM, embedder and FAISS index below are shared read-only.
+        self.history_dir = history_dir
+        self.max_history_messages = max_history_messages
+        # Append-only history, written once per turn (human + AI message)
+        self.history_storage = history_storage
+        self.history_flush_every = history_flush_every
+        self.history_flush_interval_ms = history_flush_interval_ms
+        # Rewrite the log to the live messages every n records, trimmed messages stop taking space
+        self.history_compact_every = history_compact_every
+        # Transcripts of evicted sessions move to the archive and are deleted after
+        # `history_retention_days`. Without an archive directory they are deleted right away
+        self.history_archive_dir = history_archive_dir
+        self.history_retention_days = history_retention_days
+        # The archive is swept in the background at most every `archive_prune_interval` seconds
+        self.archive_prune_interval = archive_prune_interval
+        self._last_archive_prune = None
+        # Blocking session work of the async path (history files, eviction, prompt tokenization)
+        # runs on this bounded pool, the event loop only awaits it
+        self.session_executor = ThreadPoolExecutor(max_workers=session_workers, thread_name_prefix="session")
+        self.default_language_level = language_level
+        self.sessions = SessionManager(self._create_session, max_sessions=max_sessions, ttl_seconds=session_ttl,
+                                       on_evict=self._close_session)
 
         self.index_name = "index"
         
         self.prompt_dict = prompt_dict
-        self.language_level_prompt= self.set_language_prompt(language_level)
 
         # Single template with system_message as a variable
         self.RAG_PROMPT_TEMPLATE = """
@@ -133,124 +208,620 @@ class Ollama_RAG:
         
         if ollama_base_url:
             print(f"Docker environment detected, using Ollama at: {ollama_base_url}")
-            self.llm = Ollama(model=model_name, base_url=ollama_base_url, temperature=0.1)
         else:
             print(f"Local environment detected, using default Ollama")
-            self.llm = Ollama(model=model_name, temperature=0.1)
-        embed_model = embedding_model()
-        
-        vector_store = FAISS.load_local(
-            folder_path=rag_dir,
-            index_name=self.index_name, 
-            embeddings=embed_model, 
-            allow_dangerous_deserialization=True
+        # Per-section token budgets keep the prompt, and so prefill time, bounded in long sessions.
+        # Ollama's context window is sized from them, plus `answer_tokens` for the answer
+        self.prompt_builder = PromptBuilder(TokenCounter(model_name), budget=prompt_budget)
+        num_ctx = self.prompt_builder.context_window(self.RAG_PROMPT_TEMPLATE, answer_tokens=answer_tokens)
+        self.logger.info(f"Ollama context window: {num_ctx} tokens")
+
+        # Pooled connections, keep_alive on every request and periodic heartbeats keep the model resident.
+        # Several hosts (ollama_hosts or OLLAMA_HOSTS) are load balanced by an LLMRouter
+        hosts = ollama_hosts or ollama_hosts_from_env(ollama_base_url)
+        self.ollama_client = build_llm_client(model_name, hosts, keep_alive=ollama_keep_alive, temperature=0.1,
+                                              heartbeat_interval=ollama_heartbeat_interval,
+                                              max_concurrency=ollama_max_concurrency, num_ctx=num_ctx)
+        try:
+            self.ollama_client.warmup()
+            print(f"✅ Model '{model_name}' loaded in Ollama")
+        except requests.RequestException as e:
+            self.logger.warning(f"Ollama warm-up failed, the first question will load the model: {e}")
+        self.llm = PooledOllama(client=self.ollama_client)
+        # Bounded number of generations at once, the rest queue (and see their position) or are turned away.
+        # By default every Ollama node gets its full share, adding nodes raises throughput
+        if max_concurrent_generations is None:
+            max_concurrent_generations = len(hosts) * ollama_max_concurrency
+        self.scheduler = GenerationScheduler(max_concurrent=max_concurrent_generations,
+                                             max_queue=max_queued_generations,
+                                             queue_timeout=queue_timeout, generation_timeout=generation_timeout)
+
+        # Turns older than the last `summary_keep_turns` are folded into a rolling summary,
+        # `summary_batch_turns` at a time, on a background thread after the answer was streamed
+        self.summary_keep_turns = summary_keep_turns
+        self.summary_batch_turns = summary_batch_turns
+        self.summary_chain = conversation_summary_chain(self.llm)
+        self.summary_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="summary")
+        # Async retrieval embeds queries on a fixed pool of `embedding_workers` threads,
+        # repeated queries (e.g. the example questions) are answered from the cache
+        self.query_embeddings = CachedEmbeddings(
+            PooledEmbeddings(embedding_model(), max_workers=embedding_workers),
+            model_name=EMBEDDING_MODEL_NAME,
+            max_size=query_cache_size,
+            ttl_seconds=query_cache_ttl,
+            cache_path=query_cache_path,
         )
+        embed_model = self.query_embeddings
         
-        self.retriever = vector_store.as_retriever(
-            search_type="similarity_score_threshold",
-            search_kwargs={'score_threshold': 0.3}
-        )
+        # Memory-mapped index and SQLite docstore, shared page cache across worker processes.
+        # The live version is resolved once, every file below comes from the same build
+        rag_dir = active_index_dir(rag_dir)
+        vector_store = load_index_store(rag_dir, embed_model, read_only=True)
         
-        # Create the prompt template once
+        # With reranking on, the retriever over-fetches and the cross-encoder keeps the best rerank_top_n
+        self.reranker = CrossEncoderReranker(top_n=rerank_top_n) if rerank_top_n else None
+        search_kwargs = {'score_threshold': 0.3}
+        if self.reranker is not None:
+            search_kwargs['k'] = rerank_fetch_k
+
+        parent_store = open_parent_store(rag_dir)
+        sparse_index = load_sparse_index(rag_dir) if hybrid_search else None
+        if sparse_index is not None:
+            # Dense + BM25 fused by rank, catches exact drug names and codes the embedding misses
+            self.retriever = HybridRetriever(
+                vectorstore=vector_store,
+                sparse_index=sparse_index,
+                parent_store=parent_store,
+                k=search_kwargs.get('k', 4),
+                fetch_k=max(20, search_kwargs.get('k', 4)),
+                score_threshold=search_kwargs['score_threshold'],
+            )
+        elif parent_store is not None:
+            # Small chunks are matched, the full sections they came from go into the prompt
+            self.retriever = MultiVectorRetriever(
+                vectorstore=vector_store,
+                docstore=parent_store,
+                id_key="doc_id",
+                search_type=SearchType.similarity_score_threshold,
+                search_kwargs=search_kwargs
+            )
+        else:
+            self.retriever = vector_store.as_retriever(
+                search_type="similarity_score_threshold",
+                search_kwargs=search_kwargs
+            )
+        
+        # How retrieval queries are built from the history, a list means multi-query retrieval
+        self.query_strategy = query_strategy
+
+        # Create the prompt template and chain once
         self.prompt = ChatPromptTemplate.from_template(self.RAG_PROMPT_TEMPLATE)
+        self.chain = self.prompt | self.llm | StrOutputParser()
         
-        self.logger.info("Initialization complete! Ready for chat.")
-    def set_language_prompt(self,language_level):
-        self.chat_history.messages = [ m for m in self.chat_history.messages if m.type != "system"]
-        self.chat_history.add_message(SystemMessage(content=f"{self.prompt_dict[language_level]}"))
-        self.language_level_prompt = language_level
-
-    def single_question(self,user_input):
-        history_turns = 4
-        recent_history = self.chat_history.messages[-history_turns:]  
-        history_text = " ".join(
-            [msg.content for msg in recent_history if msg.type!="system"]
+        # Precomputed answers for the example questions, see Backend/answer_cache.py
+        self.answer_cache_fingerprint = answer_cache_fingerprint(
+            rag_dir, self.index_name, self.prompt_dict, self.RAG_PROMPT_TEMPLATE, model_name
         )
+        self.answer_cache = ExampleAnswerCache(answer_cache_path, self.answer_cache_fingerprint) if answer_cache_path else None
+        if self.answer_cache is not None:
+            self.logger.info(f"Loaded {len(self.answer_cache)} precomputed example answers")
+        # Answers of earlier sessions (other patients) for near-duplicate questions. Off unless a
+        # threshold measured with `python -m Backend.answer_cache --measure_threshold` is given
+        self.semantic_cache = None
+        if semantic_cache_threshold is not None:
+            self.semantic_cache = SemanticAnswerCache(
+                self.answer_cache_fingerprint, threshold=semantic_cache_threshold, path=semantic_cache_path
+            )
 
-        # Merge last N turns with current user input
-        retrieval_query = f"{history_text}\nUser now says: {user_input}"
+        self.logger.info("Initialization complete! Ready for chat.")
+    def _create_session(self, session_id):
+        history_file = session_history_path(self.history_dir, session_id, self.history_storage)
+        if os.path.exists(history_file):
+            os.remove(history_file)
+        chat_history = FileChatMessageHistory(
+            file_path=history_file,
+            max_messages=self.max_history_messages,
+            storage=self.history_storage,
+            flush_every=self.history_flush_every,
+            flush_interval_ms=self.history_flush_interval_ms,
+            compact_every=self.history_compact_every,
+        )
+        session = ChatSession(session_id, chat_history)
+        self._apply_language_prompt(session, self.default_language_level)
+        return session
+
+    def _close_session(self, session):
+        """Flush an evicted session's history, then archive or delete its file"""
+        history = session.chat_history
+        if hasattr(history, "flush"):
+            history.flush()
+        history_file = getattr(history, "file_path", None)
+        if not history_file or not os.path.exists(history_file):
+            return
+        if not self.history_archive_dir:
+            os.remove(history_file)
+            return
+        os.makedirs(self.history_archive_dir, exist_ok=True)
+        name, extension = os.path.splitext(os.path.basename(history_file))
+        archived = os.path.join(self.history_archive_dir, f"{name}_{time.strftime('%Y%m%dT%H%M%S')}{extension}")
+        shutil.move(history_file, archived)
+        self.schedule_archive_prune()
+
+    def schedule_archive_prune(self):
+        """Sweep the archive on the session pool, at most once per `archive_prune_interval`"""
+        now = time.monotonic()
+        if self._last_archive_prune is not None and now - self._last_archive_prune < self.archive_prune_interval:
+            return
+        self._last_archive_prune = now
+        self.session_executor.submit(self.prune_history_archive)
+
+    def prune_history_archive(self):
+        """Delete archived transcripts older than `history_retention_days`"""
+        if not self.history_retention_days or not os.path.isdir(self.history_archive_dir):
+            return
+        deadline = time.time() - self.history_retention_days * 86400
+        for name in os.listdir(self.history_archive_dir):
+            path = os.path.join(self.history_archive_dir, name)
+            if os.path.isfile(path) and os.path.getmtime(path) < deadline:
+                os.remove(path)
+
+    def _apply_language_prompt(self, session, language_level):
+        session.chat_history.set_system_message(SystemMessage(content=f"{self.prompt_dict[language_level]}"))
+        session.language_level = language_level
+
+    def set_language_prompt(self,language_level, session_id=DEFAULT_SESSION_ID):
+        self._apply_language_prompt(self.sessions.get(session_id), language_level)
+
+    def build_retrieval_queries(self, chat_history, user_input):
+        """Retrieval queries for `user_input`, see Backend/query_builder.py for the strategies"""
+        return build_queries(self.query_strategy, chat_history.messages, user_input)
+
+    def build_chain_input(self, session, user_input, retrieved_docs):
+        """Prepare the prompt variables, returns (chain_input, context)"""
+        chain_input = self.prompt_builder.build(
+            self.prompt_dict[session.language_level],
+            session.chat_history.messages,
+            retrieved_docs,
+            user_input,
+            summary=getattr(session.chat_history, "summary", None),
+        )
+        return chain_input, chain_input["context"]
+
+    def commit_turn(self, session, user_input, answer, context, **metadata):
+        """Add user query and AI response to the session history"""
+        session.chat_history.add_message(HumanMessage(content=user_input))
+        session.chat_history.add_message(AIMessage(content=answer, additional_kwargs={"retrieved_context": context, **metadata}))
+        self.schedule_summary(session)
+
+    def schedule_summary(self, session):
+        """Summarize old turns in the background once `summary_batch_turns` of them are not covered yet"""
+        if not self.summary_keep_turns or session.summary_pending:
+            return
+        history = session.chat_history
+        summarized_turns = history.summary["summarized_turns"] if history.summary else 0
+        unsummarized = len(conversation_turns(history.messages)) - self.summary_keep_turns - summarized_turns
+        if unsummarized < self.summary_batch_turns:
+            return
+        session.summary_pending = True
+        self.summary_executor.submit(self.summarize_history, session)
+
+    def summarize_history(self, session):
+        history = session.chat_history
+        try:
+            # One consistent view, the request thread may append or trim while the summary is generated
+            messages, summary, dropped_turns = history.snapshot()
+            turns = conversation_turns(messages)
+            summary = summary or {"content": "", "summarized_turns": 0}
+            end = len(turns) - self.summary_keep_turns
+            conversation = "".join(format_turn(human, ai) for human, ai in turns[summary["summarized_turns"]:end])
+            chain_input = {"summary": summary["content"] or "(no summary yet)", "conversation": conversation}
+            # Counts against the generation limit and queues behind patients' questions
+            content = "".join(self.scheduler.stream(lambda: self.summary_chain.stream(chain_input),
+                                                    priority=SUMMARY_PRIORITY))
+            history.set_summary(content, end, dropped_turns)
+            self.logger.info(f"Session {session.session_id}: summary now covers {end} turns")
+        except Exception as e:
+            # The full turns stay in the prompt budget, nothing is lost
+            self.logger.warning(f"Summarizing session {session.session_id} failed: {e}")
+        finally:
+            session.summary_pending = False
+
+    def example_answer(self, session, user_input):
+        """Precomputed answer to an example question, returns (answer, context, audit metadata) or None"""
+        if self.answer_cache is None:
+            return None
+        cached = self.answer_cache.get(user_input, session.language_level)
+        if cached is None:
+            return None
+        return cached["answer"], cached["context"], {"answer_cache": "example"}
+
+    def semantic_answer(self, session, user_input, question_vector):
+        """Answer of an earlier session to a near-duplicate question, returns (answer, context, audit metadata) or None"""
+        match = self.semantic_cache.lookup(question_vector, session.language_level)
+        if match is None:
+            return None
+        entry, similarity = match
+        self.logger.info(f"Semantic cache hit ({similarity:.3f}): '{user_input}' ~ '{entry['question']}'")
+        metadata = {"answer_cache": "semantic", "cached_question": entry["question"], "similarity": similarity}
+        return entry["answer"], entry["context"], metadata
+
+    def remember_answer(self, session, user_input, question_vector, answer, context, is_first_turn):
+        # Only opening questions are stored, later answers may lean on the history
+        if self.semantic_cache is not None and is_first_turn and answer:
+            self.semantic_cache.add(question_vector, session.language_level, user_input, answer, context)
+
+    def retrieve(self, retrieval_queries, user_input):
+        """
+        Retrieve for every query and fuse the results. All query embeddings are
+        computed in one batch up front, the retriever then finds them in the cache.
+        The reranker scores the passages against `user_input`, the question being
+        answered, not against the history-expanded retrieval queries.
+        """
+        if len(retrieval_queries) > 1:
+            self.query_embeddings.embed_queries(retrieval_queries)
+        retrieved_docs = fuse_results([self.retriever.invoke(query) for query in retrieval_queries])
+        if self.reranker is not None:
+            retrieved_docs = self.reranker.rerank(user_input, retrieved_docs)
+        return retrieved_docs
+
+    async def aretrieve(self, retrieval_queries, user_input):
+        if len(retrieval_queries) > 1:
+            await self.query_embeddings.aembed_queries(retrieval_queries)
+        results = await asyncio.gather(*[self.retriever.ainvoke(query) for query in retrieval_queries])
+        retrieved_docs = fuse_results(list(results))
+        if self.reranker is not None:
+            retrieved_docs = await self.reranker.arerank(user_input, retrieved_docs)
+        return retrieved_docs
+
+    def generate_first_turn_answer(self, user_input, language_level):
+        """Answer `user_input` as the opening question of a fresh session, returns (answer, context)"""
+        chat_history = ChatMessageHistory(messages=[SystemMessage(content=f"{self.prompt_dict[language_level]}")])
+        session = ChatSession("warm-up", chat_history, language_level)
+        retrieval_queries = self.build_retrieval_queries(chat_history, user_input)
+        retrieved_docs = self.retrieve(retrieval_queries, user_input)
+        chain_input, context = self.build_chain_input(session, user_input, retrieved_docs)
+        return self.chain.invoke(chain_input), context
+
+    def stream_question(self, user_input, session_id=DEFAULT_SESSION_ID):
+        """
+        Yield the answer token by token as Ollama produces it.
 
-        # Retrieve documents using the merged query
-        retrieved_docs = self.retriever.invoke(retrieval_query)
-        # Retrieve documents using the already initialized retriever
-        #retrieved_docs = self.retriever.invoke(user_input)
-        
-        # Prepare inputs
-        context = self.format_docs(retrieved_docs)
-        formatted_history = self.format_chat_history(self.chat_history)
-        
-        
-        # Create chain with the prompt template and injected system message
-        chain = self.prompt | self.llm | StrOutputParser()
-        
-        chain_input = {
-            "context": context, 
-            "question": user_input,
-            "chat_history": formatted_history,
-            "language_level_prompt": self.language_level_prompt,
-        }
+        The turn is written to the history only after the stream completed,
+        an aborted stream leaves the history untouched. The session is marked
+        busy meanwhile, so it is not evicted under a running generation.
+        """
+        session = self.sessions.acquire(session_id)
+        try:
+            yield from self._stream_answer(session, user_input)
+        finally:
+            self.sessions.release(session)
+
+    def _stream_answer(self, session, user_input):
+        start = time.perf_counter()
+
+        is_first_turn = not any(m.type == "human" for m in session.chat_history.messages)
+        # Cached answers only stand in for opening questions, follow-ups depend on the conversation.
+        # The example cache is checked first, a hit there needs no question embedding
+        cached = self.example_answer(session, user_input) if is_first_turn else None
+        question_vector = None
+        if cached is None and is_first_turn and self.semantic_cache is not None:
+            question_vector = self.query_embeddings.embed_query(user_input)
+            cached = self.semantic_answer(session, user_input, question_vector)
+        if cached is not None:
+            answer, context, metadata = cached
+            session.last_time_to_first_token = time.perf_counter() - start
+            yield answer
+            self.commit_turn(session, user_input, answer, context, **metadata)
+            return
+
+        # Retrieve documents for the query (or queries) built from the history
+        retrieval_queries = self.build_retrieval_queries(session.chat_history, user_input)
+        retrieved_docs = self.retrieve(retrieval_queries, user_input)
+        chain_input, context = self.build_chain_input(session, user_input, retrieved_docs)
 
         full_answer = ""
-        
-        # Stream the response
-        for chunk in chain.stream(chain_input):       
-            full_answer += chunk
-
-        
-
-        # Add user query and AI response to History 
-        self.chat_history.add_message(HumanMessage(content=user_input))
-        self.chat_history.add_message(AIMessage(content=full_answer,additional_kwargs={"retrieved_context": context}))
-
- 
-        return full_answer
-        
-    
-
-
-    def format_docs(self,docs):
-        """Format documents into a string for the prompt"""
-        return "\n\n".join([doc.page_content for doc in docs])
+        time_to_first_token = None
+        try:
+            for chunk in self.scheduler.stream(lambda: self.chain.stream(chain_input), priority=int(is_first_turn)):
+                if time_to_first_token is None:
+                    time_to_first_token = time.perf_counter() - start
+                    session.last_time_to_first_token = time_to_first_token
+                    self.logger.info(f"Time to first token: {time_to_first_token:.2f}s")
+                full_answer += chunk
+                yield chunk
+        except SchedulerError as e:
+            # Shed or timed out, the turn is not written to the history
+            self.logger.warning(f"Session {session.session_id}: {type(e).__name__} {self.scheduler.stats()}")
+            yield f"\n\n{e.message}" if full_answer else e.message
+            return
+
+        total_time = time.perf_counter() - start
+        self.logger.info(f"Answer generated in {total_time:.2f}s")
+        self.logger.debug(f"Query embedding cache: {self.query_embeddings.stats()}")
+        self.commit_turn(session, user_input, full_answer, context,
+                         time_to_first_token=time_to_first_token, generation_time=total_time)
+        self.remember_answer(session, user_input, question_vector, full_answer, context, is_first_turn)
+
+    async def astream_question(self, user_input, session_id=DEFAULT_SESSION_ID):
+        """
+        Async twin of stream_question for Gradio's async handlers.
+
+        Retrieval goes through `ainvoke` (query embedding on the bounded
+        embedding pool) and generation through `astream`, which talks to
+        Ollama with an async HTTP client, so a waiting answer does not hold
+        a worker thread. Session lookup, prompt building and history writes
+        run on the session pool. While the request waits for a generation
+        slot, QueueStatus objects are yielded instead of text.
+        """
+        session = await self._aacquire(session_id)
+        try:
+            async for chunk in self._astream_answer(session, user_input):
+                yield chunk
+        finally:
+            self.sessions.release(session)
+
+    async def _in_pool(self, fn, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.session_executor, functools.partial(fn, *args, **kwargs))
+
+    async def _aacquire(self, session_id):
+        # Creating a session may evict and archive others, that file work stays off the event loop
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(self.session_executor, self.sessions.acquire, session_id)
+        try:
+            return await asyncio.shield(future)
+        except asyncio.CancelledError:
+            # The acquire still completes on the pool, its busy mark must not outlive the request
+            future.add_done_callback(lambda f: f.cancelled() or f.exception() or self.sessions.release(f.result()))
+            raise
+
+    async def _astream_answer(self, session, user_input):
+        start = time.perf_counter()
+
+        is_first_turn = not any(m.type == "human" for m in session.chat_history.messages)
+        # Same cache order as stream_question
+        cached = self.example_answer(session, user_input) if is_first_turn else None
+        question_vector = None
+        if cached is None and is_first_turn and self.semantic_cache is not None:
+            question_vector = await self.query_embeddings.aembed_query(user_input)
+            cached = self.semantic_answer(session, user_input, question_vector)
+        if cached is not None:
+            answer, context, metadata = cached
+            session.last_time_to_first_token = time.perf_counter() - start
+            yield answer
+            await self._in_pool(self.commit_turn, session, user_input, answer, context, **metadata)
+            return
+
+        retrieval_queries = self.build_retrieval_queries(session.chat_history, user_input)
+        retrieved_docs = await self.aretrieve(retrieval_queries, user_input)
+        chain_input, context = await self._in_pool(self.build_chain_input, session, user_input, retrieved_docs)
 
-    def format_chat_history(self,history):
-        """Format chat history into a string for the prompt"""
-        formatted_history = ""
-        messages = history.messages
-        
-        for i in range(0, len(messages), 2):
-            if i < len(messages):
-                user_msg = messages[i].content
-                formatted_history += f"Human: {user_msg}\n"
-                
-            if i+1 < len(messages):
-                ai_msg = messages[i+1].content
-                formatted_history += f"AI: {ai_msg}\n\n"
-        
-        return formatted_history
+        full_answer = ""
+        time_to_first_token = None
+        # Follow-up questions of running conversations go before new conversations in the queue
+        try:
+            async for chunk in self.scheduler.astream(lambda: self.chain.astream(chain_input), priority=int(is_first_turn)):
+                if isinstance(chunk, QueueStatus):
+                    yield chunk
+                    continue
+                if time_to_first_token is None:
+                    time_to_first_token = time.perf_counter() - start
+                    session.last_time_to_first_token = time_to_first_token
+                    self.logger.info(f"Time to first token: {time_to_first_token:.2f}s")
+                full_answer += chunk
+                yield chunk
+        except SchedulerError as e:
+            # Shed or timed out, the turn is not written to the history
+            self.logger.warning(f"Session {session.session_id}: {type(e).__name__} {self.scheduler.stats()}")
+            yield f"\n\n{e.message}" if full_answer else e.message
+            return
+
+        total_time = time.perf_counter() - start
+        self.logger.info(f"Answer generated in {total_time:.2f}s")
+        self.logger.debug(f"Query embedding cache: {self.query_embeddings.stats()}")
+        await self._in_pool(self.commit_turn, session, user_input, full_answer, context,
+                            time_to_first_token=time_to_first_token, generation_time=total_time)
+        await self._in_pool(self.remember_answer, session, user_input, question_vector, full_answer, context,
+                            is_first_turn)
+
+    def single_question(self,user_input, session_id=DEFAULT_SESSION_ID):
+        return "".join(self.stream_question(user_input, session_id=session_id))
 
-    
 
 class FileChatMessageHistory(BaseChatMessageHistory):
-    def __init__(self, file_path: str):
+    """
+    Chat history persisted to disk.
+
+    storage="json"  rewrites the whole message list on every change (the
+                    format read by Output_Creator/Create_pdf.ipynb).
+    storage="jsonl" appends one record per message, so a turn costs the same
+                    no matter how long the session is. Records are buffered
+                    and written together every `flush_every` messages or
+                    `flush_interval_ms` milliseconds, and the log is rewritten
+                    to the current messages every `compact_every` records.
+
+    A rolling summary of the oldest turns is stored in the same file as a
+    {"type": "summary"} record, `summarized_turns` says how many of the
+    turns in `messages` it covers.
+    """
+
+    def __init__(self, file_path: str, max_messages=None, storage="json",
+                 flush_every=1, flush_interval_ms=None, compact_every=None):
+        if storage not in ("json", "jsonl"):
+            raise ValueError(f"Unknown history storage '{storage}', use 'json' or 'jsonl'")
         self.file_path = file_path
+        # Upper bound on stored non-system messages, oldest are dropped first
+        self.max_messages = max_messages
+        self.storage = storage
+        self.flush_every = max(1, flush_every)
+        self.flush_interval_ms = flush_interval_ms
+        self.compact_every = compact_every
+
+        self.summary = None
+        self._pending = []
+        self._records_since_compaction = 0
+        self._flush_timer = None
+        # Guards messages, summary and the log, the request thread and the summarizer share the history
+        self._lock = threading.RLock()
+        # Turns dropped by _trim so far, lets a summary computed from a snapshot be re-based
+        self.dropped_turns = 0
         self._load_messages()
 
     def _load_messages(self):
+        if self.storage == "jsonl":
+            self._replay_log()
+            return
         try:
             with open(self.file_path, 'r') as f:
                 data = json.load(f)
-                self.messages = messages_from_dict(data)
         except (FileNotFoundError, json.JSONDecodeError):
             self.messages = []
+            return
+        summaries = [record for record in data if record.get("type") == "summary"]
+        self.summary = summaries[-1]["data"] if summaries else None
+        self.messages = messages_from_dict([record for record in data if record.get("type") != "summary"])
+
+    def _replay_log(self):
+        """Stream the append-only log back into memory, one record at a time"""
+        self.messages = []
+        try:
+            f = open(self.file_path, 'rb')
+        except FileNotFoundError:
+            return
+        torn_at = None
+        with f:
+            offset = 0
+            for line in f:
+                if not line.endswith(b"\n"):
+                    # A crash during an append leaves at most one partial line, at the end
+                    torn_at = offset
+                    break
+                offset += len(line)
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                self._records_since_compaction += 1
+                if record.get("type") == "summary":
+                    self.summary = record["data"]
+                    continue
+                message = messages_from_dict([record])[0]
+                if message.type == "system":
+                    self.messages = [m for m in self.messages if m.type != "system"]
+                self.messages.append(message)
+                self._trim()
+        if torn_at is not None:
+            # Cut the partial line off, the next append would otherwise continue it and be lost
+            with open(self.file_path, 'r+b') as f:
+                f.truncate(torn_at)
+
+    def _summary_record(self):
+        # A copy, buffered records must not change when _trim updates the summary
+        return {"type": "summary", "data": dict(self.summary)}
 
     def _save_messages(self):
-        with open(self.file_path, 'w') as f:
-            json.dump(messages_to_dict(self.messages), f, indent=2)
+        # Write to a temporary file first so a crash never leaves half a file behind
+        records = messages_to_dict(self.messages)
+        if self.summary is not None:
+            records.append(self._summary_record())
+        tmp_path = f"{self.file_path}.tmp"
+        with open(tmp_path, 'w') as f:
+            if self.storage == "jsonl":
+                for record in records:
+                    f.write(json.dumps(record) + "\n")
+            else:
+                json.dump(records, f, indent=2)
+        os.replace(tmp_path, self.file_path)
+
+    def _trim(self):
+        if self.max_messages is None:
+            return
+        system = [m for m in self.messages if m.type == "system"]
+        others = [m for m in self.messages if m.type != "system"]
+        if len(others) > self.max_messages:
+            dropped = others[:-self.max_messages]
+            self.messages = system + others[-self.max_messages:]
+            dropped_turns = sum(1 for m in dropped if m.type == "ai")
+            self.dropped_turns += dropped_turns
+            if self.summary is not None:
+                # Dropped turns were the oldest ones, which the summary already covers
+                self.summary["summarized_turns"] = max(0, self.summary["summarized_turns"] - dropped_turns)
+
+    def _append(self, record):
+        with self._lock:
+            self._pending.append(record)
+            if len(self._pending) >= self.flush_every:
+                self._flush_locked()
+            elif self.flush_interval_ms and self._flush_timer is None:
+                self._flush_timer = threading.Timer(self.flush_interval_ms / 1000, self.flush)
+                self._flush_timer.daemon = True
+                self._flush_timer.start()
+
+    def _flush_locked(self):
+        if self._flush_timer is not None:
+            self._flush_timer.cancel()
+            self._flush_timer = None
+        if not self._pending:
+            return
+        with open(self.file_path, 'a') as f:
+            f.write("".join(json.dumps(record) + "\n" for record in self._pending))
+        self._records_since_compaction += len(self._pending)
+        self._pending = []
+
+        if self.compact_every and self._records_since_compaction >= self.compact_every:
+            self._save_messages()
+            self._records_since_compaction = len(self.messages) + (self.summary is not None)
+
+    def flush(self) -> None:
+        """Write buffered records to disk (jsonl storage only)"""
+        with self._lock:
+            self._flush_locked()
 
     def add_message(self, message: BaseMessage) -> None:
-        self.messages.append(message)
-        self._save_messages()
+        with self._lock:
+            self.messages.append(message)
+            self._trim()
+            if self.storage == "jsonl":
+                self._append(messages_to_dict([message])[0])
+            else:
+                self._save_messages()
+
+    def set_system_message(self, message: SystemMessage) -> None:
+        """Replace any previous system message (e.g. the language level prompt)"""
+        with self._lock:
+            self.messages = [m for m in self.messages if m.type != "system"]
+            self.add_message(message)
+
+    def snapshot(self):
+        """(messages, summary, dropped_turns) as of one moment, for work done outside the lock"""
+        with self._lock:
+            summary = dict(self.summary) if self.summary is not None else None
+            return list(self.messages), summary, self.dropped_turns
+
+    def set_summary(self, content, summarized_turns, dropped_turns=None):
+        """
+        Store the rolling summary covering the oldest `summarized_turns` turns.
+        `dropped_turns` of the snapshot the summary was computed from shifts the
+        count by the turns trimmed since.
+        """
+        with self._lock:
+            if dropped_turns is not None:
+                summarized_turns = max(0, summarized_turns - (self.dropped_turns - dropped_turns))
+            self.summary = {"content": content, "summarized_turns": summarized_turns}
+            if self.storage == "jsonl":
+                self._append(self._summary_record())
+            else:
+                self._save_messages()
 
     def clear(self) -> None:
-        self.messages = []
-        self._save_messages()
+        with self._lock:
+            self.messages = []
+            self.summary = None
+            if self.storage == "jsonl":
+                self._pending = []
+                self._save_messages()
+                self._records_since_compaction = 0
+            else:
+                self._save_messages()
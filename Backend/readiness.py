@@ -0,0 +1,123 @@
+"""
+Readiness of the app's dependencies (Ollama, the model, the index, the RAG model).
+
+Checks are plain functions returning True/False. They run concurrently,
+their results are cached for `ttl` seconds, and waiting for them polls with
+exponential backoff and short timeouts, so startup continues as soon as a
+dependency is up instead of after a fixed sleep.
+
+`create_app` serves the Gradio UI together with two endpoints for orchestrators:
+
+    GET /health  liveness, 200 as long as the process serves requests
+    GET /ready   readiness, 200 once every check passes, 503 with the failing checks before
+"""
+import json
+import logging
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+
+logger = logging.getLogger(__name__)
+
+
+def http_get_json(url, timeout=1.0):
+    """GET `url` and decode the JSON body, None if the server is not reachable or answers with an error"""
+    try:
+        with urllib.request.urlopen(url, timeout=timeout) as response:
+            return json.loads(response.read() or b"null")
+    except (urllib.error.URLError, OSError, ValueError):
+        return None
+
+
+def ollama_models(host, timeout=1.0):
+    """Names of the models an Ollama server has pulled, None if it is not reachable"""
+    data = http_get_json(f"{host.rstrip('/')}/api/tags", timeout=timeout)
+    if data is None:
+        return None
+    return [model["name"] for model in data.get("models", [])]
+
+
+def ollama_reachable(host, timeout=1.0):
+    return ollama_models(host, timeout=timeout) is not None
+
+
+def ollama_has_model(host, model_name, timeout=1.0):
+    models = ollama_models(host, timeout=timeout) or []
+    return model_name in models or f"{model_name}:latest" in models
+
+
+def wait_until(check, timeout=60, initial_delay=0.1, max_delay=2.0, factor=2.0):
+    """Call `check` until it returns True, sleeping with exponential backoff, False after `timeout`"""
+    deadline = time.monotonic() + timeout
+    delay = initial_delay
+    while True:
+        if check():
+            return True
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return False
+        time.sleep(min(delay, remaining))
+        delay = min(delay * factor, max_delay)
+
+
+class Readiness:
+    """Named readiness checks, run concurrently and cached for `ttl` seconds"""
+
+    def __init__(self, ttl=5.0, max_workers=8):
+        self.ttl = ttl
+        self.checks = {}
+        self._results = {}
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="readiness")
+
+    def add(self, name, check):
+        self.checks[name] = check
+        self._results.pop(name, None)
+
+    def _run(self, name):
+        try:
+            ok = bool(self.checks[name]())
+        except Exception as e:
+            logger.warning(f"Readiness check '{name}' failed: {e}")
+            ok = False
+        self._results[name] = (ok, time.monotonic())
+        return ok
+
+    def status(self, names=None, refresh=False):
+        """{name: passed} for `names` (all checks by default), stale results are rerun concurrently"""
+        names = list(self.checks) if names is None else names
+        now = time.monotonic()
+        stale = [name for name in names
+                 if refresh or name not in self._results or now - self._results[name][1] > self.ttl]
+        list(self.executor.map(self._run, stale))
+        return {name: self._results[name][0] for name in names}
+
+
+def create_app(demo, readiness):
+    """FastAPI app serving the Gradio `demo` at / plus /health and /ready"""
+    import gradio as gr
+    from fastapi import FastAPI
+    from fastapi.responses import JSONResponse
+
+    app = FastAPI()
+
+    @app.get("/health")
+    def health():
+        return {"status": "alive"}
+
+    @app.get("/ready")
+    def ready():
+        checks = readiness.status()
+        return JSONResponse({"ready": all(checks.values()), "checks": checks},
+                            status_code=200 if all(checks.values()) else 503)
+
+    return gr.mount_gradio_app(app, demo, path="/")
+
+
+def serve(demo, readiness, host="127.0.0.1", port=7860):
+    """Run the Gradio UI with the health and readiness endpoints"""
+    import uvicorn
+
+    print(f"Serving on http://{host}:{port} (health: /health, readiness: /ready)")
+    uvicorn.run(create_app(demo, readiness), host=host, port=port, log_level="warning")
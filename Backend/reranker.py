@@ -0,0 +1,94 @@
+import asyncio
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from Backend.embeddings import normalize_query
+from Backend.helpers import reranking_model
+
+
+class CrossEncoderReranker:
+    """
+    Second retrieval stage: scores (query, passage) pairs with bge-reranker.
+
+    The retriever over-fetches candidates, all pairs are scored in one
+    batched forward pass and only the best `top_n` passages reach the prompt.
+    Pair scores are kept in an LRU cache, the example questions hit the same
+    passages again and again. Runs on the GPU when there is one, else on CPU.
+    """
+
+    def __init__(self, model_name="BAAI/bge-reranker-large", top_n=4, batch_size=16, max_length=512,
+                 cache_size=4096):
+        try:
+            pipe = reranking_model(model_name)
+        except (RuntimeError, AssertionError) as e:
+            # CUDA visible but not usable (driver mismatch, out of memory)
+            print(f"⚠️ Reranker could not be placed on the GPU, using CPU: {e}")
+            pipe = reranking_model(model_name, device=-1)
+        self.model = pipe.model.eval()
+        self.tokenizer = pipe.tokenizer
+        self.device = pipe.device
+        self.top_n = top_n
+        self.batch_size = batch_size
+        self.max_length = max_length
+        self.cache_size = cache_size
+        self.hits = 0
+        self.misses = 0
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        # One forward pass at a time, concurrent requests would only split the same cores
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="reranker")
+
+    @staticmethod
+    def _key(query, passage):
+        return normalize_query(query), hashlib.sha1(passage.encode("utf-8")).hexdigest()
+
+    def _score_pairs(self, pairs):
+        import torch
+
+        scores = []
+        with torch.inference_mode():
+            for start in range(0, len(pairs), self.batch_size):
+                batch = pairs[start:start + self.batch_size]
+                inputs = self.tokenizer(
+                    [query for query, _ in batch], [passage for _, passage in batch],
+                    padding=True, truncation=True, max_length=self.max_length, return_tensors="pt",
+                ).to(self.device)
+                scores.extend(self.model(**inputs).logits.view(-1).float().cpu().tolist())
+        return scores
+
+    def score(self, query, passages):
+        """Relevance score for every passage, only uncached pairs go through the model"""
+        keys = [self._key(query, passage) for passage in passages]
+        scores = [None] * len(passages)
+        with self._lock:
+            for i, key in enumerate(keys):
+                if key in self._cache:
+                    self._cache.move_to_end(key)
+                    scores[i] = self._cache[key]
+        missing = [i for i, score in enumerate(scores) if score is None]
+        self.hits += len(passages) - len(missing)
+        self.misses += len(missing)
+
+        if missing:
+            new_scores = self._score_pairs([(query, passages[i]) for i in missing])
+            with self._lock:
+                for i, score in zip(missing, new_scores):
+                    scores[i] = score
+                    self._cache[keys[i]] = score
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        return scores
+
+    def rerank(self, query, documents, top_n=None):
+        """Return the `top_n` most relevant documents, best first"""
+        if not documents:
+            return documents
+        scores = self.score(query, [doc.page_content for doc in documents])
+        ranked = sorted(zip(scores, range(len(documents))), reverse=True)
+        return [documents[i] for _, i in ranked[:top_n or self.top_n]]
+
+    async def arerank(self, query, documents, top_n=None):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, self.rerank, query, documents, top_n)
@@ -0,0 +1,192 @@
+"""
+Admission control in front of the LLM.
+
+At most `max_concurrent` generations run at once, further requests wait in a
+priority queue (FIFO within a priority) and see their position in the UI.
+When the queue is full new requests are turned away right away, and waiting
+or generating longer than the timeouts ends the request with a friendly
+message instead of letting every patient's latency grow together.
+"""
+import asyncio
+import heapq
+import itertools
+import threading
+import time
+
+
+class SchedulerError(Exception):
+    message = "Sorry, something went wrong while answering. Please ask your question again."
+
+    def __init__(self):
+        super().__init__(self.message)
+
+
+class ServerBusy(SchedulerError):
+    message = "⚠️ Many patients are using the assistant right now. Please ask your question again in a minute."
+
+
+class QueueTimeout(SchedulerError):
+    message = "⚠️ Your question waited too long for a free slot. Please ask it again in a moment."
+
+
+class GenerationTimeout(SchedulerError):
+    message = "⚠️ The answer took too long and was stopped. Please try again or ask a shorter question."
+
+
+class QueueStatus:
+    """Yielded instead of a token while the request waits, `position` 1 is next in line"""
+
+    def __init__(self, position):
+        self.position = position
+
+    @property
+    def message(self):
+        return (f"⏳ Many questions are being answered right now. You are number {self.position} "
+                f"in the queue, your answer will start shortly.")
+
+
+class _Ticket:
+
+    def __init__(self, priority, seq, loop=None):
+        self.priority = priority
+        self.seq = seq
+        self.loop = loop
+        self.admitted = False
+        self.event = asyncio.Event() if loop is not None else threading.Event()
+
+    def __lt__(self, other):
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+    def wake(self):
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self.event.set)
+        else:
+            self.event.set()
+
+
+class GenerationScheduler:
+    """
+    Bounded concurrency + priority queue, shared by the sync and async code paths.
+    A lower `priority` value is served first.
+    """
+
+    def __init__(self, max_concurrent=4, max_queue=32, queue_timeout=60, generation_timeout=180,
+                 status_interval=1.0):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.generation_timeout = generation_timeout
+        self.status_interval = status_interval
+        self.running = 0
+        self.shed = 0
+        self._waiting = []
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+
+    def _enter(self, priority, loop=None):
+        """None when admitted right away, else the ticket to wait on"""
+        with self._lock:
+            if self.running < self.max_concurrent and not self._waiting:
+                self.running += 1
+                return None
+            if len(self._waiting) >= self.max_queue:
+                self.shed += 1
+                raise ServerBusy()
+            ticket = _Ticket(priority, next(self._seq), loop)
+            heapq.heappush(self._waiting, ticket)
+            return ticket
+
+    def _position(self, ticket):
+        with self._lock:
+            return 1 + sum(1 for other in self._waiting if other < ticket)
+
+    def _leave_queue(self, ticket):
+        """Take a ticket out of the queue, True if it was admitted in the meantime"""
+        with self._lock:
+            if ticket.admitted:
+                return True
+            self._waiting.remove(ticket)
+            heapq.heapify(self._waiting)
+            return False
+
+    def _release(self):
+        with self._lock:
+            self.running -= 1
+            if self._waiting:
+                # Hand the slot straight to the next request
+                ticket = heapq.heappop(self._waiting)
+                ticket.admitted = True
+                self.running += 1
+                ticket.wake()
+
+    def stats(self):
+        with self._lock:
+            return {"running": self.running, "waiting": len(self._waiting), "shed": self.shed}
+
+    async def astream(self, make_stream, priority=0):
+        """Yield QueueStatus while waiting, then the chunks of `make_stream()`"""
+        loop = asyncio.get_running_loop()
+        ticket = self._enter(priority, loop)
+        if ticket is not None:
+            admitted = False
+            deadline = loop.time() + self.queue_timeout
+            last_position = None
+            try:
+                while not ticket.admitted:
+                    position = self._position(ticket)
+                    if position != last_position:
+                        last_position = position
+                        yield QueueStatus(position)
+                    remaining = deadline - loop.time()
+                    if remaining <= 0:
+                        raise QueueTimeout()
+                    try:
+                        await asyncio.wait_for(ticket.event.wait(), min(self.status_interval, remaining))
+                    except asyncio.TimeoutError:
+                        pass
+                admitted = True
+            finally:
+                # Timed out or cancelled, a slot handed over meanwhile must be given back
+                if not admitted and self._leave_queue(ticket):
+                    self._release()
+
+        try:
+            stream = make_stream()
+            deadline = loop.time() + self.generation_timeout
+            try:
+                while True:
+                    try:
+                        chunk = await asyncio.wait_for(stream.__anext__(), deadline - loop.time())
+                    except StopAsyncIteration:
+                        break
+                    except asyncio.TimeoutError:
+                        raise GenerationTimeout()
+                    yield chunk
+            finally:
+                aclose = getattr(stream, "aclose", None)
+                if aclose is not None:
+                    await aclose()
+        finally:
+            self._release()
+
+    def stream(self, make_stream, priority=0):
+        """Blocking twin of astream, waits without reporting the queue position"""
+        ticket = self._enter(priority)
+        if ticket is not None:
+            admitted = False
+            try:
+                if not ticket.event.wait(self.queue_timeout):
+                    raise QueueTimeout()
+                admitted = True
+            finally:
+                if not admitted and self._leave_queue(ticket):
+                    self._release()
+
+        try:
+            start = time.monotonic()
+            for chunk in make_stream():
+                if time.monotonic() - start > self.generation_timeout:
+                    raise GenerationTimeout()
+                yield chunk
+        finally:
+            self._release()
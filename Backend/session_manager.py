@@ -0,0 +1,112 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class ChatSession:
+    """Per-user chat state: own history, own language level."""
+
+    def __init__(self, session_id, chat_history, language_level=None):
+        self.session_id = session_id
+        self.chat_history = chat_history
+        self.language_level = language_level
+        self.last_time_to_first_token = None
+        # Set while a background summary of this session's history is running
+        self.summary_pending = False
+        # Answers being generated for this session, busy sessions are never evicted
+        self.in_flight = 0
+        self.last_used = time.monotonic()
+
+    def touch(self):
+        self.last_used = time.monotonic()
+
+
+class SessionManager:
+    """
+    Keeps one ChatSession per Gradio session id.
+
+    Sessions live in an LRU ordered dict and are dropped once more than
+    `max_sessions` are open or after `ttl_seconds` without activity.
+    Sessions taken with acquire() stay until release(), even if that means
+    more than `max_sessions` are open for a while.
+    `on_evict(session)` is called for every dropped session, outside the lock.
+    The lock only guards the dict itself, never a running generation, so
+    concurrent chats do not wait on each other.
+    """
+
+    def __init__(self, session_factory, max_sessions=256, ttl_seconds=3600, on_evict=None):
+        self.session_factory = session_factory
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self.on_evict = on_evict
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, session_id, acquire=False):
+        """Return the session for `session_id`, creating it on first use."""
+        with self._lock:
+            evicted = self._evict_expired()
+            session = self._sessions.get(session_id)
+            if session is None:
+                session = self.session_factory(session_id)
+                self._sessions[session_id] = session
+                # Never the session that was just asked for
+                evicted.extend(self._evict_overflow(keep=session_id))
+            else:
+                self._sessions.move_to_end(session_id)
+            if acquire:
+                session.in_flight += 1
+            session.touch()
+        self._notify(evicted)
+        return session
+
+    def acquire(self, session_id):
+        """get() and mark the session busy until release(), e.g. for the length of a generation"""
+        return self.get(session_id, acquire=True)
+
+    def release(self, session):
+        with self._lock:
+            session.in_flight -= 1
+            session.touch()
+            if session.session_id in self._sessions:
+                self._sessions.move_to_end(session.session_id)
+
+    def drop(self, session_id):
+        with self._lock:
+            session = self._sessions.pop(session_id, None)
+        self._notify([session] if session is not None else [])
+
+    def _notify(self, evicted):
+        if self.on_evict is None:
+            return
+        for session in evicted:
+            self.on_evict(session)
+
+    def _evict_overflow(self, keep=None):
+        """Least recently used idle sessions beyond `max_sessions`"""
+        evicted = []
+        for session_id, session in list(self._sessions.items()):
+            if len(self._sessions) <= self.max_sessions:
+                break
+            if not session.in_flight and session_id != keep:
+                evicted.append(self._sessions.pop(session_id))
+        return evicted
+
+    def _evict_expired(self):
+        evicted = []
+        if not self.ttl_seconds:
+            return evicted
+        deadline = time.monotonic() - self.ttl_seconds
+        # Oldest sessions are at the front of the ordered dict
+        for session_id, session in list(self._sessions.items()):
+            if session.last_used >= deadline:
+                break
+            if not session.in_flight:
+                evicted.append(self._sessions.pop(session_id))
+        return evicted
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def __contains__(self, session_id):
+        return session_id in self._sessions
@@ -0,0 +1,223 @@
+"""
+BM25 index over the same chunks as the FAISS index, for exact terms the
+dense search misses (drug names, procedure codes, dosages).
+
+    index_bm25_{data,indices,indptr}.npy  chunk x term BM25 weights (scipy CSC arrays)
+    index.sqlite                           bm25_docs (row -> chunk id) and bm25_terms (term -> column)
+
+The weights are computed at ingestion, a query only sums the columns of
+its terms, so a lookup is one sparse column slice and a partial sort.
+Serving memory-maps the arrays and looks ids and terms up in SQLite, so
+startup does not grow with the index and worker processes share the page
+cache, like the FAISS index.
+"""
+import json
+import os
+import re
+import sqlite3
+from collections import Counter
+from collections.abc import Mapping
+from typing import Any, Optional
+
+import numpy as np
+from scipy import sparse
+from langchain_core.retrievers import BaseRetriever
+
+from Backend.index_store import DOCSTORE_FILE, SQLiteConnection
+
+
+BM25_ARRAYS = ("data", "indices", "indptr")
+BM25_FILES = [f"index_bm25_{name}.npy" for name in BM25_ARRAYS]
+# Format of earlier versions, weights and ids loaded into memory
+LEGACY_BM25_FILES = ["index_bm25.npz", "index_bm25.json"]
+
+# Keeps "5-fluorouracil", "2.5mg" or "icd-10" together as one token
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[.\-/][a-z0-9]+)*")
+
+
+def tokenize(text):
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+class SQLiteRowIds:
+    """Chunk id of a BM25 row, looked up on demand"""
+
+    def __init__(self, db):
+        self.db = db
+
+    def __getitem__(self, row):
+        return self.db.query("SELECT doc_id FROM bm25_docs WHERE row = ?", (int(row),))[0][0]
+
+    def __len__(self):
+        return self.db.query("SELECT COUNT(*) FROM bm25_docs")[0][0]
+
+
+class SQLiteVocabulary(Mapping):
+    """Term -> BM25 column, looked up on demand"""
+
+    def __init__(self, db):
+        self.db = db
+
+    def __getitem__(self, term):
+        rows = self.db.query("SELECT col FROM bm25_terms WHERE term = ?", (term,))
+        if not rows:
+            raise KeyError(term)
+        return rows[0][0]
+
+    def __iter__(self):
+        for (term,) in self.db.query("SELECT term FROM bm25_terms ORDER BY col"):
+            yield term
+
+    def __len__(self):
+        return self.db.query("SELECT COUNT(*) FROM bm25_terms")[0][0]
+
+
+class BM25Index:
+    """`doc_ids` maps rows to chunk ids and `vocabulary` terms to columns, in memory or in SQLite"""
+
+    def __init__(self, weights, doc_ids, vocabulary):
+        self.weights = weights.tocsc()
+        self.doc_ids = doc_ids
+        self.vocabulary = vocabulary
+
+    @classmethod
+    def build(cls, doc_ids, texts, k1=1.5, b=0.75):
+        vocabulary = {}
+        rows, cols, counts = [], [], []
+        for row, text in enumerate(texts):
+            for term, count in Counter(tokenize(text)).items():
+                rows.append(row)
+                cols.append(vocabulary.setdefault(term, len(vocabulary)))
+                counts.append(count)
+
+        tf = sparse.csr_matrix((np.array(counts, dtype="float32"), (rows, cols)),
+                               shape=(len(texts), len(vocabulary)))
+        doc_len = np.asarray(tf.sum(axis=1)).ravel()
+        avg_len = doc_len.mean() if len(doc_len) else 0.0
+        df = np.bincount(tf.indices, minlength=len(vocabulary))
+        idf = np.log(1 + (len(texts) - df + 0.5) / (df + 0.5))
+
+        # BM25 term weight per (chunk, term), the query side is a plain sum
+        row_of = np.repeat(np.arange(len(texts)), np.diff(tf.indptr))
+        norm = k1 * (1 - b + b * doc_len[row_of] / max(avg_len, 1e-9))
+        tf.data = (idf[tf.indices] * tf.data * (k1 + 1) / (tf.data + norm)).astype("float32")
+        return cls(tf, list(doc_ids), vocabulary)
+
+    def search(self, query, k=20):
+        """Return [(doc_id, score)] of the `k` best chunks, chunks without a query term are left out"""
+        cols = sorted({col for col in map(self.vocabulary.get, set(tokenize(query))) if col is not None})
+        if not cols:
+            return []
+        scores = np.asarray(self.weights[:, cols].sum(axis=1)).ravel()
+        candidates = np.flatnonzero(scores)
+        if len(candidates) > k:
+            candidates = candidates[np.argpartition(-scores[candidates], k)[:k]]
+        candidates = candidates[np.argsort(-scores[candidates])]
+        return [(self.doc_ids[i], float(scores[i])) for i in candidates]
+
+    def save(self, folder_path):
+        """Write the weight arrays and add the id and term tables to the folder's index.sqlite"""
+        for name, file in zip(BM25_ARRAYS, BM25_FILES):
+            np.save(os.path.join(folder_path, file), getattr(self.weights, name))
+        connection = sqlite3.connect(os.path.join(folder_path, DOCSTORE_FILE))
+        with connection:
+            connection.execute("DROP TABLE IF EXISTS bm25_docs")
+            connection.execute("DROP TABLE IF EXISTS bm25_terms")
+            connection.execute("CREATE TABLE bm25_docs (row INTEGER PRIMARY KEY, doc_id TEXT)")
+            connection.execute("CREATE TABLE bm25_terms (term TEXT PRIMARY KEY, col INTEGER)")
+            connection.executemany("INSERT INTO bm25_docs (row, doc_id) VALUES (?, ?)", enumerate(self.doc_ids))
+            connection.executemany("INSERT INTO bm25_terms (term, col) VALUES (?, ?)", self.vocabulary.items())
+        connection.close()
+
+    def __len__(self):
+        return len(self.doc_ids)
+
+
+def build_sparse_index(vectorstore):
+    """BM25 index over every chunk of a FAISS vector store"""
+    doc_ids = list(vectorstore.index_to_docstore_id.values())
+    texts = [vectorstore.docstore.search(doc_id).page_content for doc_id in doc_ids]
+    return BM25Index.build(doc_ids, texts)
+
+
+def load_sparse_index(folder_path):
+    """BM25 index of the vector store in `folder_path`, None for indexes built without one"""
+    paths = [os.path.join(folder_path, file) for file in BM25_FILES]
+    if all(os.path.exists(path) for path in paths):
+        data, indices, indptr = (np.load(path, mmap_mode="r") for path in paths)
+        db = SQLiteConnection(os.path.join(folder_path, DOCSTORE_FILE), read_only=True)
+        doc_ids = SQLiteRowIds(db)
+        weights = sparse.csc_matrix((data, indices, indptr), shape=(len(doc_ids), len(indptr) - 1), copy=False)
+        return BM25Index(weights, doc_ids, SQLiteVocabulary(db))
+
+    weights_path, vocab_path = (os.path.join(folder_path, file) for file in LEGACY_BM25_FILES)
+    if not os.path.exists(vocab_path):
+        return None
+    with open(vocab_path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    vocabulary = {term: col for col, term in enumerate(data["vocabulary"])}
+    return BM25Index(sparse.load_npz(weights_path), data["doc_ids"], vocabulary)
+
+
+def reciprocal_rank_fusion(rankings, rrf_k=60):
+    """Fuse ranked id lists, every list adds 1 / (rrf_k + rank) to an id's score"""
+    scores = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (rrf_k + rank + 1)
+    return sorted(scores, key=scores.get, reverse=True)
+
+
+class HybridRetriever(BaseRetriever):
+    """
+    Dense FAISS search and BM25 search fused with reciprocal-rank fusion.
+
+    Both searches return `fetch_k` chunks, the best `k` fused chunks are
+    returned, or the parent sections they point to when a parent store is set.
+    """
+
+    vectorstore: Any
+    sparse_index: Any
+    parent_store: Optional[Any] = None
+    id_key: str = "doc_id"
+    k: int = 4
+    fetch_k: int = 20
+    score_threshold: float = 0.3
+    rrf_k: int = 60
+
+    def _chunk_id(self, doc):
+        # Chunks from before the parent store were indexed under their doc_id
+        return doc.metadata.get("chunk_id", doc.metadata.get(self.id_key))
+
+    def _fuse(self, dense_hits, query):
+        chunks = {self._chunk_id(doc): doc for doc, _ in dense_hits}
+        sparse_ids = [doc_id for doc_id, _ in self.sparse_index.search(query, self.fetch_k)]
+        fused_ids = reciprocal_rank_fusion([list(chunks), sparse_ids], self.rrf_k)[:self.k]
+        return [chunks[doc_id] if doc_id in chunks else self.vectorstore.docstore.search(doc_id)
+                for doc_id in fused_ids]
+
+    def _parent_ids(self, chunks):
+        parent_ids = []
+        for chunk in chunks:
+            parent_id = chunk.metadata.get(self.id_key)
+            if parent_id is not None and parent_id not in parent_ids:
+                parent_ids.append(parent_id)
+        return parent_ids
+
+    def _get_relevant_documents(self, query, *, run_manager=None):
+        dense_hits = self.vectorstore.similarity_search_with_relevance_scores(
+            query, k=self.fetch_k, score_threshold=self.score_threshold
+        )
+        chunks = self._fuse(dense_hits, query)
+        if self.parent_store is None:
+            return chunks
+        return [doc for doc in self.parent_store.mget(self._parent_ids(chunks)) if doc is not None]
+
+    async def _aget_relevant_documents(self, query, *, run_manager=None):
+        dense_hits = await self.vectorstore.asimilarity_search_with_relevance_scores(
+            query, k=self.fetch_k, score_threshold=self.score_threshold
+        )
+        chunks = self._fuse(dense_hits, query)
+        if self.parent_store is None:
+            return chunks
+        return [doc for doc in await self.parent_store.amget(self._parent_ids(chunks)) if doc is not None]
@@ -0,0 +1,85 @@
+"""
+Startup cost of the entrypoints: import time per module and time until Gradio's port is open.
+
+    python -m Backend.startup_benchmark
+    python -m Backend.startup_benchmark --port_cmd "python run_chatbot.py --model dummy --check_missing False"
+
+Every import is measured in a fresh interpreter with `python -X importtime`,
+so modules cached by an earlier measurement do not hide their cost.
+"""
+import argparse
+import shlex
+import socket
+import subprocess
+import sys
+import time
+
+
+DEFAULT_MODULES = [
+    "Backend.model_loader",
+    "Frontend.frontend",
+    "Backend.rag_model",
+    "Backend.helpers",
+    "Backend.create_vectorDB",
+]
+
+
+def import_time(module, top=5):
+    """Wall time of `import module` and its slowest imports as [(cumulative seconds, name)]"""
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                            capture_output=True, text=True)
+    wall_time = time.perf_counter() - start
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+
+    imports = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = [part.strip() for part in line[len("import time:"):].split("|")]
+        # Third-party packages wherever they are first imported, submodules count towards them
+        if "." not in name and name not in ("Backend", "Frontend"):
+            imports.append((int(cumulative) / 1e6, name))
+    return wall_time, sorted(imports, reverse=True)[:top]
+
+
+def time_to_port(command, port=7860, host="127.0.0.1", timeout=300):
+    """Start `command` and measure how long it takes until `port` accepts connections"""
+    start = time.perf_counter()
+    process = subprocess.Popen(shlex.split(command), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while time.perf_counter() - start < timeout:
+            if process.poll() is not None:
+                raise RuntimeError(f"'{command}' exited with code {process.returncode}")
+            try:
+                with socket.create_connection((host, port), timeout=0.2):
+                    return time.perf_counter() - start
+            except OSError:
+                time.sleep(0.1)
+        raise TimeoutError(f"Port {port} was not opened within {timeout}s")
+    finally:
+        process.terminate()
+        process.wait()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure import and startup time of the entrypoints")
+    parser.add_argument("--modules", type=str, nargs="+", default=DEFAULT_MODULES)
+    parser.add_argument("--top", type=int, default=5, help="Slowest imports shown per module")
+    parser.add_argument("--port_cmd", type=str, default=None, help="Entrypoint command to time until its port opens")
+    parser.add_argument("--port", type=int, default=7860)
+    args = parser.parse_args()
+
+    for module in args.modules:
+        try:
+            wall_time, slowest = import_time(module, args.top)
+        except RuntimeError as e:
+            print(f"⚠️ {module}: {e}")
+            continue
+        print(f"\n{module}: {wall_time:.2f}s")
+        for seconds, name in slowest:
+            print(f"    {seconds:>6.2f}s  {name}")
+
+    if args.port_cmd:
+        print(f"\nTime to port {args.port}: {time_to_port(args.port_cmd, args.port):.2f}s")
@@ -16,6 +16,9 @@ from langchain_community.vectorstores import FAISS
 from langchain.schema import Document
 from transformers import BlipProcessor, BlipForConditionalGeneration
 
+# One index factory for the whole project, see Backend/helpers.py
+from Backend.helpers import create_vector_store
+
 
 
 
@@ -236,17 +239,3 @@ def table_to_html(table):
         html += "  </tr>\n"
     html += "</table>"
     return html
-
-
-def create_vector_store(embeddings_model, n_list:int=50):
-    dimensions = len(embeddings_model.embed_query("hello world"))
-    quantizer = faiss.IndexFlatL2(dimensions)
-    index = faiss.IndexIVFFlat(quantizer, dimensions,n_list, faiss.METRIC_L2 )
-
-    vector_store = FAISS(
-        embedding_function=embeddings_model,
-        index=index,
-        docstore=InMemoryDocstore(),
-        index_to_docstore_id={})
-
-    return vector_store
\ No newline at end of file
@@ -3,7 +3,7 @@ import yaml
 
 
 class ChatApp:
-    def __init__(self,Model ,frontend_dict_path = "./Frontend/assets/frontend_text.yaml"):
+    def __init__(self,Model ,frontend_dict_path = "./Frontend/assets/frontend_text.yaml", concurrency_limit=64):
         with open(frontend_dict_path, "r", encoding='utf-8') as file:
             frontend_text = yaml.safe_load(file)
 
@@ -11,20 +11,33 @@ class ChatApp:
         self.topics = list(frontend_text["topic_questions"].keys()) 
         self.topic_questions =frontend_text["topic_questions"]
         self.html_code =frontend_text["html_code"]
-        self.language_mode = gr.State("standard")
 
         self.Model = Model
+        # Chats are async, many of them can wait on Ollama at the same time
+        self.concurrency_limit = concurrency_limit
 
-    def respond(self,message, history): 
-        response = self.Model.single_question(message)
-        return response
+    async def respond(self,message, history, request: gr.Request): 
+        # Each browser tab has its own Gradio session hash, the model keeps
+        # a separate history and language level per session
+        # Tokens are forwarded as they arrive, Gradio expects the text so far
+        response = ""
+        async for token in self.Model.astream_question(message, session_id=request.session_hash):
+            if not isinstance(token, str):
+                # Queue or loading status while the question waits for the model, replaced by the answer
+                yield token.message
+                continue
+            response += token
+            yield response
 
 
 
+    def model_status(self):
+        # Models built in the background report their readiness, polling stops once loading is over
+        return self.Model.status, gr.Timer(active=self.Model.state == "starting")
+
     # Navigation
-    def go_to_chat(self,lang_mode):
-        self.language_mode.value = self.language_modes[lang_mode]
-        self.Model.set_language_prompt(self.language_mode.value)
+    def go_to_chat(self,lang_mode, request: gr.Request):
+        self.Model.set_language_prompt(self.language_modes[lang_mode], session_id=request.session_hash)
         return "page3", lang_mode
 
     def change_examplequestions(self,topic):
@@ -52,6 +65,11 @@ class ChatApp:
                 with gr.Row():
                     gr.Image(value="./Frontend/assets/LogoP1.png", height=250, width=250, show_label=False, show_download_button=False, elem_id="icon")
                 gr.Markdown("## How should I talk to you?")
+                if hasattr(self.Model, "status"):
+                    status = gr.Markdown(self.Model.status)
+                    status_timer = gr.Timer(2)
+                    status_timer.tick(self.model_status, None, [status, status_timer])
+                    demo.load(self.model_status, None, [status, status_timer])
                 for idx, (key,val) in enumerate(self.language_modes.items()):
                     gr.Button(key, elem_id=f"lang-button-{idx}").click(self.go_to_chat, [gr.State(key)], [self.current_page, self.selected_lang])
 
@@ -66,7 +84,8 @@ class ChatApp:
                         gr.ChatInterface(
                             fn=self.respond,
                             title=bot_name,
-                            examples=bot_info
+                            examples=bot_info,
+                            concurrency_limit=self.concurrency_limit
                         )
                     containers[bot_name] = container
                 
@@ -113,11 +132,15 @@ class ChatApp:
 
 class dummy_model:
     def __init__(self):
-        self.language_level_prompt = "default"
-    def single_question(self,message):
-        return message + "  " + self.language_level_prompt
-    def set_language_prompt(self,language):
-        self.language_level_prompt = f"new language = {language}"
+        self.language_level_prompt = {}
+    def single_question(self,message, session_id="default"):
+        return message + "  " + self.language_level_prompt.get(session_id, "default")
+    def stream_question(self,message, session_id="default"):
+        yield self.single_question(message, session_id=session_id)
+    async def astream_question(self,message, session_id="default"):
+        yield self.single_question(message, session_id=session_id)
+    def set_language_prompt(self,language, session_id="default"):
+        self.language_level_prompt[session_id] = f"new language = {language}"
 
 
 if __name__ == "__main__":
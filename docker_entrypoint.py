@@ -6,11 +6,10 @@ Simplified startup script that assumes Docker environment
 import os
 import sys
 import yaml
-import time
 import logging
-from Backend.rag_model import Ollama_RAG, dummy_model
+from Backend.model_loader import BackgroundModel
+from Backend.readiness import Readiness, ollama_has_model, ollama_reachable, serve, wait_until
 from Frontend.frontend import ChatApp
-from Backend.create_vectorDB import create_vectorstore_from_pdfs
 
 # Setup logging
 logging.basicConfig(
@@ -21,21 +20,12 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-def wait_for_ollama(host="http://ollama:11434", max_retries=30):
-    """Wait for Ollama service to be ready"""
-    import requests
-    
+def wait_for_ollama(host="http://ollama:11434", timeout=60):
+    """Wait for Ollama service to be ready, polling with backoff"""
     print(f"Waiting for Ollama service at {host}...")
-    for i in range(max_retries):
-        try:
-            response = requests.get(f"{host}/api/tags")
-            if response.status_code == 200:
-                print("✓ Ollama service is ready")
-                return True
-        except:
-            pass
-        time.sleep(2)
-        print(f"  Retrying... ({i+1}/{max_retries})")
+    if wait_until(lambda: ollama_reachable(host), timeout=timeout):
+        print("✓ Ollama service is ready")
+        return True
     
     print("✗ Ollama service failed to start")
     return False
@@ -49,16 +39,9 @@ def ensure_model(model_name, host="http://ollama:11434"):
         return True
     
     # Check if model exists
-    try:
-        response = requests.get(f"{host}/api/tags")
-        models = response.json().get('models', [])
-        model_names = [m['name'] for m in models]
-        
-        if model_name in model_names or f"{model_name}:latest" in model_names:
-            print(f"✓ Model '{model_name}' is available")
-            return True
-    except Exception as e:
-        print(f"Error checking models: {e}")
+    if ollama_has_model(host, model_name):
+        print(f"✓ Model '{model_name}' is available")
+        return True
     
     # Pull model
     print(f"Pulling model '{model_name}'...")
@@ -81,11 +64,17 @@ def ensure_model(model_name, host="http://ollama:11434"):
 
 def vector_store_exists(index_dir):
     """Check if FAISS vector store files actually exist"""
+    from Backend.index_store import active_index_dir
+
+    # Builds are published as versions/<name>/, CURRENT names the live one
+    index_dir = active_index_dir(index_dir)
     index_file = os.path.join(index_dir, "index.faiss")
+    docstore_file = os.path.join(index_dir, "index.sqlite")
     pkl_file = os.path.join(index_dir, "index.pkl")
     
     print(f"DEBUG: Checking {index_dir}")
     print(f"DEBUG: index.faiss exists: {os.path.exists(index_file)}")
+    print(f"DEBUG: index.sqlite exists: {os.path.exists(docstore_file)}")
     print(f"DEBUG: index.pkl exists: {os.path.exists(pkl_file)}")
     
     if os.path.exists(index_dir):
@@ -94,10 +83,19 @@ def vector_store_exists(index_dir):
     else:
         print(f"DEBUG: Directory {index_dir} does not exist")
     
-    result = os.path.exists(index_file) and os.path.exists(pkl_file)
+    # index.pkl is the docstore format of older versions
+    result = os.path.exists(index_file) and (os.path.exists(docstore_file) or os.path.exists(pkl_file))
     print(f"DEBUG: vector_store_exists returning: {result}")
     return result
 
+def exit_on_failure(error):
+    """Model loading failed: exit so `restart: unless-stopped` retries instead of serving a dead app"""
+    logger.error(f"Model loading failed, exiting: {error}")
+    sys.stdout.flush()
+    sys.stderr.flush()
+    # sys.exit would only end the loader thread
+    os._exit(1)
+
 def main():
     # Configuration
     model_name = os.getenv('MODEL_NAME', 'gpt-oss:20b')
@@ -112,47 +110,6 @@ def main():
     print(f"Model: {model_name}")
     print(f"Ollama Host: {ollama_host}")
     
-    # Wait for Ollama if not using dummy model
-    if model_name != "dummy":
-        if not wait_for_ollama(ollama_host):
-            sys.exit(1)
-        
-        if not ensure_model(model_name, ollama_host):
-            sys.exit(1)
-    
-    # Check/Create vector database - properly check for actual FAISS files
-    if not vector_store_exists(index_dir):
-        print(f"\nVector store files not found in {index_dir}")
-        print("Creating vector store from PDFs...")
-        
-        # Check if PDF directory exists and has files
-        if not os.path.exists(pdf_dir):
-            print(f"✗ PDF directory '{pdf_dir}' not found")
-            sys.exit(1)
-        
-        pdf_files = [f for f in os.listdir(pdf_dir) if f.lower().endswith('.pdf')]
-        if not pdf_files:
-            print(f"✗ No PDF files found in '{pdf_dir}'")
-            sys.exit(1)
-        
-        print(f"Found {len(pdf_files)} PDF file(s): {pdf_files}")
-        
-        try:
-            create_vectorstore_from_pdfs(pdf_dir, index_dir, chunk_size=1000, chunk_overlap=200)
-            print("✓ Vector store created successfully")
-            
-            # Verify creation
-            if not vector_store_exists(index_dir):
-                print("✗ Vector store creation appeared to succeed but files are missing")
-                sys.exit(1)
-                
-        except Exception as e:
-            print(f"✗ Failed to create vector store: {e}")
-            logger.error(f"Vector store creation failed: {e}")
-            sys.exit(1)
-    else:
-        print("✓ Vector store already exists")
-    
     # Load prompts
     if not os.path.exists(path_prompts):
         print(f"✗ Prompts file not found at {path_prompts}")
@@ -166,10 +123,56 @@ def main():
     except Exception as e:
         print(f"✗ Failed to load prompts: {e}")
         sys.exit(1)
-    
-    # Initialize RAG model
-    print(f"\nInitializing RAG model...")
-    try:
+
+    def load_model(set_stage):
+        """Runs in the background while Gradio already serves the start page, failures are shown there"""
+        # Wait for Ollama if not using dummy model
+        if model_name != "dummy":
+            set_stage("Waiting for Ollama")
+            if not wait_for_ollama(ollama_host):
+                raise RuntimeError(f"Ollama service at {ollama_host} did not start")
+            
+            set_stage(f"Checking the model '{model_name}'")
+            if not ensure_model(model_name, ollama_host):
+                raise RuntimeError(f"Model '{model_name}' is not available")
+        
+        # Heavy imports (LangChain, FAISS, ingestion libraries) happen here, not at startup
+        from Backend.create_vectorDB import create_vectorstore_from_pdfs, sync_vectorstore
+        from Backend.rag_model import Ollama_RAG, dummy_model
+
+        # Check/Create vector database - properly check for actual FAISS files
+        if not vector_store_exists(index_dir):
+            print(f"\nVector store files not found in {index_dir}")
+            set_stage("Creating the vector store from the PDFs")
+            
+            # Check if PDF directory exists and has files
+            if not os.path.exists(pdf_dir):
+                raise RuntimeError(f"PDF directory '{pdf_dir}' not found")
+            
+            pdf_files = [f for f in os.listdir(pdf_dir) if f.lower().endswith('.pdf')]
+            if not pdf_files:
+                raise RuntimeError(f"No PDF files found in '{pdf_dir}'")
+            
+            print(f"Found {len(pdf_files)} PDF file(s): {pdf_files}")
+            
+            create_vectorstore_from_pdfs(pdf_dir, index_dir, chunk_size=1000, chunk_overlap=200)
+            print("✓ Vector store created successfully")
+            
+            # Verify creation
+            if not vector_store_exists(index_dir):
+                raise RuntimeError("Vector store creation appeared to succeed but files are missing")
+        else:
+            print("✓ Vector store already exists, syncing with PDFs...")
+            set_stage("Syncing the vector store with the PDFs")
+            try:
+                # Embeds only new or changed PDFs and drops deleted ones
+                sync_vectorstore(pdf_dir, index_dir)
+            except Exception as e:
+                print(f"✗ Failed to sync vector store, using the existing one: {e}")
+                logger.error(f"Vector store sync failed: {e}")
+        
+        # Initialize RAG model
+        set_stage("Loading the search index and the language model")
         if model_name == "dummy":
             rag_model = dummy_model()
         else:
@@ -177,10 +180,16 @@ def main():
             os.environ['OLLAMA_HOST'] = ollama_host
             rag_model = Ollama_RAG(init_prompt, prompts, index_dir, model_name, logger)
         print("✓ RAG model initialized successfully")
-    except Exception as e:
-        print(f"✗ Failed to initialize RAG model: {e}")
-        logger.error(f"RAG model initialization failed: {e}")
-        sys.exit(1)
+        return rag_model
+
+    rag_model = BackgroundModel(load_model, on_failure=exit_on_failure)
+
+    # /ready answers 503 until Ollama, the model and the RAG model are up, /health once the server runs
+    readiness = Readiness()
+    if model_name != "dummy":
+        readiness.add("ollama", lambda: ollama_reachable(ollama_host))
+        readiness.add("model", lambda: ollama_has_model(ollama_host, model_name))
+    readiness.add("rag_model", lambda: rag_model.ready)
     
     # Launch Gradio app
     print("\nStarting Gradio interface...")
@@ -188,14 +197,8 @@ def main():
         app = ChatApp(rag_model)
         demo = app.build()
         
-        # Launch with Docker-friendly settings
-        demo.launch(
-            server_name="0.0.0.0",  # Listen on all interfaces
-            server_port=7860,
-            share=False,
-            inbrowser=False,
-            show_error=True
-        )
+        # Listen on all interfaces, with the health endpoints next to the UI
+        serve(demo, readiness, host="0.0.0.0", port=7860)
     except Exception as e:
         print(f"✗ Failed to start Gradio interface: {e}")
         logger.error(f"Gradio launch failed: {e}")
@@ -1,16 +1,14 @@
 import warnings
 warnings.filterwarnings("ignore" )
 import subprocess
-import importlib.util
-import time
 import threading
 import gradio as gr
 
 import os
 import yaml
-from Backend.helpers import is_model_available, pull_model
-from Backend.create_vectorDB import create_vectorstore_from_pdfs
-from Backend.rag_model import Ollama_RAG, dummy_model
+from Backend.environment import ensure_requirements
+from Backend.model_loader import BackgroundModel
+from Backend.readiness import Readiness, ollama_has_model, ollama_reachable, serve, wait_until
 from Frontend.frontend import ChatApp
 
 import logging
@@ -28,19 +26,6 @@ logger = logging.getLogger(__name__)
 logger.info("Initialization complete!")
 
 
-REQUIREMENTS_FILE = "requirements.txt"
-
-def install_missing_requirements():
-    with open(REQUIREMENTS_FILE) as f:
-        packages = [line.strip() for line in f if line.strip() and not line.startswith("#")]
-
-    for pkg in packages:
-        module_name = pkg.split("==")[0].split(">=")[0].split("<=")[0].strip()
-
-        if importlib.util.find_spec(module_name) is None:
-            print(f"Installing missing package: {pkg}")
-            subprocess.check_call(["pip", "install", pkg])
-
 def start_ollama():
     try:
         subprocess.Popen(["ollama", "serve"], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
@@ -57,12 +42,14 @@ def chat_fn_rag(message, history):
     response = rag_model.single_question(message)
     return response
 
-def launch_gradio(model):
+def launch_gradio(model, readiness):
     #iface = gr.ChatInterface(fn=chat_fn_rag)
     #iface.launch(share=False, inbrowser=False) # change inbrowser to true to open directly 
     app = ChatApp(model)
     demo = app.build()
-    demo.launch(share=False, inbrowser=False)
+    serve(demo, readiness,
+          host=os.getenv("GRADIO_SERVER_NAME", "127.0.0.1"),
+          port=int(os.getenv("GRADIO_SERVER_PORT", 7860)))
 
 def str2bool(v):
     if isinstance(v, bool):
@@ -78,6 +65,9 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Web-App for doc2chat ")
     parser.add_argument("--model", type=str, required=False,default="mistral", help="Path to the configuration file.",choices=["mistral","dummy","gpt-oss"])
     parser.add_argument('--check_missing', type = str2bool,required = False, default=True, help="check for missing packages etc. ")
+    parser.add_argument("--semantic_cache_threshold", type=float, required=False, default=None, help="Reuse earlier answers to opening questions at least this similar (off by default, see README)")
+    parser.add_argument("--rerank_top_n", type=int, required=False, default=None, help="Rerank retrieved chunks with bge-reranker and keep the best n (off by default)")
+    parser.add_argument("--query_strategy", type=str, nargs="+", required=False, default=["user_turns"], choices=["history","user_turns","last_question","keywords"], help="How retrieval queries are built, several strategies enable multi-query retrieval")
     args = parser.parse_args()
 
     check_missing = args.check_missing 
@@ -86,33 +76,13 @@ if __name__ == "__main__":
     pdf_dir = "data"
     index_dir = "meta_data/faiss_index"
     path_prompts = "meta_data/prompts.yaml"
+    ollama_host = os.getenv("OLLAMA_HOST") or "http://localhost:11434"
     print(check_missing, type(check_missing))
     if  check_missing: 
-        # Step 1: Install missing packages
-        install_missing_requirements()
+        # Step 1: Install missing packages, only checked when requirements.txt or the interpreter changed
+        ensure_requirements()
 
-    # Step 2: Start Ollama in background check if model is available
-    if not is_dummy:
-        threading.Thread(target=start_ollama, daemon=True).start()
-        time.sleep(5)  # Wait for Ollama to start
-
-    if check_missing: 
-
-        if not is_dummy:
-            if is_model_available(model_name):
-                print(f"Model '{model_name}' is available locally.")
-            else:
-                print(f"Model '{model_name}' is not available locally.")
-                pull_model(model_name)
-
-        # Step 3: Check if VectorDB is created else create from documents in data directory
-        if not os.path.exists("meta_data/faiss_index"):
-            print("Creating vector store from PDFs...")
-            create_vectorstore_from_pdfs(pdf_dir, index_dir, chunk_size=1000, chunk_overlap=200)
-        else:
-            print("Vector store already exists, skipping creation.")
-
-    # Step 4: Load Prompt Dict 
+    # Step 2: Load Prompt Dict 
     if not os.path.exists(path_prompts):
         print(f"Prompts file not found at {path_prompts}. Please ensure it exists.")    
     else:
@@ -121,8 +91,50 @@ if __name__ == "__main__":
             init_prompt = list(prompts.keys())[0]
         print("Prompts loaded successfully.",prompts.items())
         print(init_prompt)
-    # Step 5: Init RAG Model
-    rag_model = Ollama_RAG(init_prompt,prompts,index_dir,model_name,logger)  if not is_dummy else dummy_model()
-    # Step 4: Launch Gradio app
-    launch_gradio(rag_model)
 
+    # Step 3: Ollama, the vector store and the RAG model are set up in the background,
+    # Gradio opens its port right away and shows the progress on the start page
+    def load_model(set_stage):
+        # Heavy imports (LangChain, FAISS, ingestion libraries) happen here, not at startup
+        from Backend.helpers import is_model_available, pull_model
+        from Backend.rag_model import Ollama_RAG, dummy_model
+
+        if not is_dummy and not ollama_reachable(ollama_host):
+            set_stage("Starting Ollama")
+            threading.Thread(target=start_ollama, daemon=True).start()
+            # Continue as soon as the server answers instead of after a fixed sleep
+            if not wait_until(lambda: ollama_reachable(ollama_host), timeout=60):
+                raise RuntimeError(f"Ollama did not start at {ollama_host}")
+
+        if check_missing: 
+
+            if not is_dummy:
+                if is_model_available(model_name):
+                    print(f"Model '{model_name}' is available locally.")
+                else:
+                    print(f"Model '{model_name}' is not available locally.")
+                    set_stage(f"Downloading the model '{model_name}'")
+                    pull_model(model_name)
+
+            # Create the VectorDB from documents in data directory, or update it for new/changed/deleted PDFs
+            set_stage("Syncing the vector store with the PDFs")
+            from Backend.create_vectorDB import sync_vectorstore
+            sync_vectorstore(pdf_dir, index_dir)
+
+        # Init RAG Model
+        set_stage("Loading the search index and the language model")
+        if is_dummy:
+            return dummy_model()
+        return Ollama_RAG(init_prompt,prompts,index_dir,model_name,logger, rerank_top_n=args.rerank_top_n, query_strategy=args.query_strategy, semantic_cache_threshold=args.semantic_cache_threshold)
+
+    rag_model = BackgroundModel(load_model)
+
+    # /ready reports these checks, /health only that the server is up
+    readiness = Readiness()
+    if not is_dummy:
+        readiness.add("ollama", lambda: ollama_reachable(ollama_host))
+        readiness.add("model", lambda: ollama_has_model(ollama_host, model_name))
+    readiness.add("rag_model", lambda: rag_model.ready)
+
+    # Step 4: Launch Gradio app
+    launch_gradio(rag_model, readiness)
@@ -0,0 +1,68 @@
+import pytest
+
+pytest.importorskip("langchain_community")
+
+from langchain_core.messages import AIMessage, HumanMessage
+
+from Backend.rag_model import FileChatMessageHistory
+
+
+def contents(history):
+    return [message.content for message in history.messages]
+
+
+def test_jsonl_log_replays_appended_messages(tmp_path):
+    path = str(tmp_path / "session.jsonl")
+    history = FileChatMessageHistory(path, storage="jsonl")
+    history.add_message(HumanMessage(content="q1"))
+    history.add_message(AIMessage(content="a1"))
+    history.set_summary("asked about q1", 1)
+
+    replayed = FileChatMessageHistory(path, storage="jsonl")
+    assert contents(replayed) == ["q1", "a1"]
+    assert replayed.summary == {"content": "asked about q1", "summarized_turns": 1}
+
+
+def test_torn_last_line_is_cut_off(tmp_path):
+    path = tmp_path / "session.jsonl"
+    history = FileChatMessageHistory(str(path), storage="jsonl")
+    history.add_message(HumanMessage(content="q1"))
+    history.add_message(AIMessage(content="a1"))
+    intact = path.read_bytes()
+    # A crash in the middle of an append
+    with open(path, "ab") as f:
+        f.write(b'{"type": "human", "data": {"content": "lo')
+
+    replayed = FileChatMessageHistory(str(path), storage="jsonl")
+    assert contents(replayed) == ["q1", "a1"]
+    assert path.read_bytes() == intact
+
+    replayed.add_message(HumanMessage(content="after crash"))
+    assert contents(FileChatMessageHistory(str(path), storage="jsonl")) == ["q1", "a1", "after crash"]
+
+
+def test_compaction_keeps_the_trimmed_messages(tmp_path):
+    path = tmp_path / "session.jsonl"
+    history = FileChatMessageHistory(str(path), max_messages=2, storage="jsonl", compact_every=4)
+    for i in range(3):
+        history.add_message(HumanMessage(content=f"q{i}"))
+        history.add_message(AIMessage(content=f"a{i}"))
+
+    assert len(path.read_text().splitlines()) < 6
+    assert contents(FileChatMessageHistory(str(path), max_messages=2, storage="jsonl")) == ["q2", "a2"]
+
+
+def test_summary_from_a_snapshot_is_rebased_on_turns_trimmed_since(tmp_path):
+    history = FileChatMessageHistory(str(tmp_path / "session.jsonl"), max_messages=4, storage="jsonl")
+    for i in range(2):
+        history.add_message(HumanMessage(content=f"q{i}"))
+        history.add_message(AIMessage(content=f"a{i}"))
+    _, _, dropped_turns = history.snapshot()
+
+    # The next turn arrives while the summary of the first turn is generated and trims it
+    history.add_message(HumanMessage(content="q2"))
+    history.add_message(AIMessage(content="a2"))
+    history.set_summary("asked about q0", 1, dropped_turns)
+
+    assert contents(history) == ["q1", "a1", "q2", "a2"]
+    assert history.summary["summarized_turns"] == 0
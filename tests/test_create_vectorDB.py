@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+
+faiss = pytest.importorskip("faiss")
+pytest.importorskip("langchain_community")
+
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores import FAISS
+
+from Backend.create_vectorDB import add_vectors, remove_vectors
+
+
+DIMENSIONS = 8
+
+
+def vector_store(index):
+    return FAISS(embedding_function=None, index=index, docstore=InMemoryDocstore(), index_to_docstore_id={})
+
+
+def ivf_store(vectors):
+    index = faiss.IndexIVFFlat(faiss.IndexFlatL2(DIMENSIONS), DIMENSIONS, 4)
+    index.train(vectors)
+    index.nprobe = 4
+    return vector_store(index)
+
+
+def nearest_chunk(store, vector):
+    doc, _ = store.similarity_search_with_score_by_vector(vector.tolist(), k=1)[0]
+    return doc.page_content
+
+
+@pytest.mark.parametrize("make_store", [ivf_store, lambda vectors: vector_store(faiss.IndexFlatL2(DIMENSIONS))],
+                         ids=["ivf", "flat"])
+def test_remove_then_add_keeps_vectors_and_chunks_aligned(make_store):
+    vectors = np.random.default_rng(0).random((300, DIMENSIONS), dtype="float32")
+    store = make_store(vectors)
+    ids = [f"chunk {i}" for i in range(300)]
+    add_vectors(store, ids[:200], vectors[:200], [{}] * 200, ids[:200])
+
+    remove_vectors(store, ids[50:100])
+    add_vectors(store, ids[200:], vectors[200:], [{}] * 100, ids[200:])
+
+    assert store.index.ntotal == 250
+    assert len(store.index_to_docstore_id) == 250
+    for i in [*range(50), *range(100, 300)]:
+        assert nearest_chunk(store, vectors[i]) == ids[i]
+    assert nearest_chunk(store, vectors[75]) != ids[75]
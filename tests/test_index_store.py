@@ -0,0 +1,43 @@
+import os
+import threading
+
+import pytest
+
+pytest.importorskip("faiss")
+pytest.importorskip("langchain_community")
+
+from langchain_core.documents import Document
+
+from Backend.index_store import (PARENT_STORE_FILE, SQLiteDocumentStore, active_index_dir, new_index_version,
+                                 open_parent_store, publish_index_version)
+
+
+def publish_parents(index_dir, text):
+    version_dir = new_index_version(index_dir)
+    SQLiteDocumentStore(os.path.join(version_dir, PARENT_STORE_FILE)).mset([("doc", Document(page_content=text))])
+    publish_index_version(index_dir, version_dir)
+    return version_dir
+
+
+def test_publish_switches_current_and_keeps_previous(tmp_path):
+    first = publish_parents(tmp_path, "v1")
+    second = publish_parents(tmp_path, "v2")
+    assert active_index_dir(tmp_path) == second
+    assert os.path.isdir(first)
+
+    third = publish_parents(tmp_path, "v3")
+    assert sorted(os.listdir(tmp_path / "versions")) == sorted([os.path.basename(second), os.path.basename(third)])
+
+
+def test_open_store_survives_pruning_of_its_version(tmp_path):
+    publish_parents(tmp_path, "v1")
+    store = open_parent_store(active_index_dir(tmp_path))
+    # Two more syncs prune the version the "server" opened
+    publish_parents(tmp_path, "v2")
+    publish_parents(tmp_path, "v3")
+
+    results = []
+    worker = threading.Thread(target=lambda: results.append(store.mget(["doc"])[0].page_content))
+    worker.start()
+    worker.join()
+    assert results == ["v1"]
@@ -0,0 +1,111 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from Backend.llm_router import LLMRouter
+from Backend.ollama_client import OllamaClient
+from Backend.ollama_stub import StubOllama
+
+
+@pytest.fixture
+def stubs():
+    nodes = [StubOllama(token_delay=0.02).start() for _ in range(2)]
+    yield nodes
+    for node in nodes:
+        node.stop()
+
+
+def make_router(stubs, **kwargs):
+    kwargs.setdefault("health_interval", None)
+    return LLMRouter([OllamaClient("mistral", base_url=stub.url) for stub in stubs], **kwargs)
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "condition not reached in time"
+        time.sleep(0.02)
+
+
+def test_fails_over_before_the_first_token(stubs):
+    down, up = stubs
+    down.down = True
+    router = make_router([down, up])
+    try:
+        assert "".join(router.stream("hi")) == "Hello, world"
+        first, second = router.stats()
+        assert (first["healthy"], first["failures"]) == (False, 1)
+        assert (second["healthy"], second["served"]) == (True, 1)
+    finally:
+        router.close()
+
+
+def test_async_fails_over_before_the_first_token(stubs):
+    down, up = stubs
+    down.down = True
+    router = make_router([down, up])
+
+    async def answer():
+        chunks = [chunk async for chunk in router.astream("hi")]
+        for client in (endpoint.client for endpoint in router.endpoints):
+            for session in client._async_sessions.values():
+                await session.close()
+        return "".join(chunks)
+
+    try:
+        assert asyncio.run(answer()) == "Hello, world"
+        assert up.requests == 1
+    finally:
+        router.close()
+
+
+def test_no_failover_once_tokens_were_sent(stubs):
+    for stub in stubs:
+        stub.fail_after = 1
+    router = make_router(stubs)
+    try:
+        chunks = []
+        with pytest.raises(RuntimeError):
+            for chunk in router.stream("hi"):
+                chunks.append(chunk)
+        assert chunks == ["Hello"]
+        assert sum(stub.requests for stub in stubs) == 1
+    finally:
+        router.close()
+
+
+def test_respects_the_per_node_limit(stubs):
+    router = make_router(stubs, max_concurrency=1)
+    try:
+        with ThreadPoolExecutor(max_workers=6) as pool:
+            answers = list(pool.map(lambda i: "".join(router.stream(f"question {i}")), range(6)))
+        assert answers == ["Hello, world"] * 6
+        assert [stub.peak for stub in stubs] == [1, 1]
+        assert sum(node["served"] for node in router.stats()) == 6
+    finally:
+        router.close()
+
+
+def test_health_check_brings_a_node_back(stubs):
+    flaky, _ = stubs
+    flaky.down = True
+    router = make_router(stubs, health_interval=0.05)
+    try:
+        wait_for(lambda: not router.endpoints[0].healthy)
+        flaky.down = False
+        wait_for(lambda: router.endpoints[0].healthy)
+    finally:
+        router.close()
+
+
+def test_raises_when_every_node_is_down(stubs):
+    for stub in stubs:
+        stub.down = True
+    router = make_router(stubs)
+    try:
+        with pytest.raises(ConnectionError):
+            "".join(router.stream("hi"))
+    finally:
+        router.close()
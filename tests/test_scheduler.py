@@ -0,0 +1,77 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from Backend.scheduler import GenerationScheduler, QueueStatus, QueueTimeout, ServerBusy
+
+
+def blocking_stream(release):
+    def make_stream():
+        release.wait(5)
+        yield "answer"
+    return make_stream
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "condition not reached in time"
+        time.sleep(0.01)
+
+
+def test_sheds_requests_when_the_queue_is_full():
+    scheduler = GenerationScheduler(max_concurrent=1, max_queue=1, queue_timeout=5)
+    release = threading.Event()
+    answers = []
+    workers = [threading.Thread(target=lambda: answers.append("".join(scheduler.stream(blocking_stream(release)))))
+               for _ in range(2)]
+    for worker in workers:
+        worker.start()
+    wait_for(lambda: scheduler.stats() == {"running": 1, "waiting": 1, "shed": 0})
+
+    with pytest.raises(ServerBusy):
+        next(scheduler.stream(blocking_stream(release)))
+    assert scheduler.stats()["shed"] == 1
+
+    release.set()
+    for worker in workers:
+        worker.join()
+    assert answers == ["answer", "answer"]
+    assert scheduler.stats() == {"running": 0, "waiting": 0, "shed": 1}
+
+
+def test_queue_timeout_leaves_the_slot_free():
+    scheduler = GenerationScheduler(max_concurrent=1, max_queue=4, queue_timeout=0.1)
+    release = threading.Event()
+    worker = threading.Thread(target=lambda: "".join(scheduler.stream(blocking_stream(release))))
+    worker.start()
+    wait_for(lambda: scheduler.stats()["running"] == 1)
+
+    with pytest.raises(QueueTimeout):
+        next(scheduler.stream(blocking_stream(release)))
+    release.set()
+    worker.join()
+    assert scheduler.stats() == {"running": 0, "waiting": 0, "shed": 0}
+
+
+def test_async_waiters_see_their_position_then_the_answer():
+    scheduler = GenerationScheduler(max_concurrent=1, max_queue=4, status_interval=0.01)
+
+    async def tokens(delay):
+        await asyncio.sleep(delay)
+        yield "answer"
+
+    async def collect(delay):
+        return [chunk async for chunk in scheduler.astream(lambda: tokens(delay))]
+
+    async def main():
+        first = asyncio.ensure_future(collect(0.1))
+        await asyncio.sleep(0.02)
+        return await asyncio.gather(first, collect(0))
+
+    first, second = asyncio.run(main())
+    assert first == ["answer"]
+    assert isinstance(second[0], QueueStatus) and second[0].position == 1
+    assert second[-1] == "answer"
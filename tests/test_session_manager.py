@@ -0,0 +1,63 @@
+import time
+
+from Backend.session_manager import ChatSession, SessionManager
+
+
+def make_manager(**kwargs):
+    evicted = []
+    manager = SessionManager(lambda session_id: ChatSession(session_id, chat_history=None),
+                             on_evict=evicted.append, **kwargs)
+    return manager, evicted
+
+
+def test_lru_evicts_idle_sessions():
+    manager, evicted = make_manager(max_sessions=2)
+    for session_id in ["a", "b", "c"]:
+        manager.get(session_id)
+    assert [s.session_id for s in evicted] == ["a"]
+    assert "a" not in manager and len(manager) == 2
+
+
+def test_busy_session_survives_lru_overflow():
+    manager, evicted = make_manager(max_sessions=2)
+    busy = manager.acquire("a")
+    for session_id in ["b", "c", "d"]:
+        manager.get(session_id)
+    assert "a" in manager
+    assert [s.session_id for s in evicted] == ["b", "c"]
+
+    # Once the generation finished, the session is an ordinary (most recently used) one again
+    manager.release(busy)
+    assert busy.in_flight == 0
+    manager.get("e")
+    assert "a" in manager and "d" not in manager
+
+
+def test_all_sessions_busy_exceeds_limit_temporarily():
+    manager, evicted = make_manager(max_sessions=1)
+    first = manager.acquire("a")
+    second = manager.acquire("b")
+    assert len(manager) == 2 and not evicted
+    manager.release(first)
+    manager.release(second)
+    manager.get("c")
+    assert len(manager) == 1
+
+
+def test_busy_session_survives_ttl():
+    manager, evicted = make_manager(ttl_seconds=0.05)
+    busy = manager.acquire("a")
+    manager.get("b")
+    time.sleep(0.1)
+    manager.get("c")
+    assert "a" in manager and "b" not in manager
+    assert [s.session_id for s in evicted] == ["b"]
+    manager.release(busy)
+
+
+def test_drop_notifies():
+    manager, evicted = make_manager()
+    manager.get("a")
+    manager.drop("a")
+    manager.drop("missing")
+    assert [s.session_id for s in evicted] == ["a"]
@@ -0,0 +1,26 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("faiss")
+pytest.importorskip("langchain_community")
+
+from Backend.sparse_index import BM25Index, load_sparse_index
+
+
+def is_memory_mapped(array):
+    while array is not None and not isinstance(array, np.memmap):
+        array = array.base
+    return array is not None
+
+
+def test_saved_index_is_memory_mapped_and_searches_like_the_built_one(tmp_path):
+    texts = ["insulin dosage for type 2 diabetes", "blood pressure and salt intake", "insulin pump settings"]
+    built = BM25Index.build(["a", "b", "c"], texts)
+    built.save(tmp_path)
+
+    loaded = load_sparse_index(tmp_path)
+    assert all(is_memory_mapped(a) for a in (loaded.weights.data, loaded.weights.indices, loaded.weights.indptr))
+    assert len(loaded) == 3
+    for query in ["insulin", "salt intake", "unknown words"]:
+        assert loaded.search(query) == built.search(query)
+    assert {doc_id for doc_id, _ in loaded.search("insulin")} == {"a", "c"}